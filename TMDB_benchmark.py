@@ -0,0 +1,423 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""TMDB_benchmark.py script.
+
+Mesures de performance de TMDB_fetcher.py sur une arborescence synthétique de films,
+avec un serveur local qui remplace TMDB (recherche, détails, générique, affiches).
+
+memory : chaque film a déjà sa fiche (60 acteurs), le parcours construit le catalogue et le fichier des fiches
+         sans interroger TMDB ; on mesure la mémoire gardée par les films à la fin du parcours et le pic de mémoire.
+         Avec --resolve, les films n'ont pas de fiche et sont recherchés sur le serveur local (--defer, sans affiches).
+run    : TMDB_fetcher.py est lancé sur l'arborescence, avec le serveur local, pour un parcours complet, une relance,
+         une mise à jour --file et un --cleanup ; on mesure pour chacun la durée, les appels API, les octets
+         téléchargés et le pic de mémoire (RSS) du processus.
+startup : démarrage à froid de chaque mode (--help, --cleanup, --query, --offline, --file) : durée,
+         temps passé dans les imports et import ou non des modules réseau.
+server : lance seulement le serveur local, pour des essais à la main
+         (TMDB_API_URL et TMDB_IMAGE_URL redirigent TMDB_fetcher.py vers ce serveur).
+
+This tool builds a synthetic movie tree and measures TMDB_fetcher.py on it, against a local stand-in of TMDB.
+
+
+Usage:
+    TMDB_benchmark.py memory [--films=<n>] [--dir=<path>] [--resolve] [--workers=<n>]
+    TMDB_benchmark.py run [--films=<n>] [--dir=<path>] [--workers=<n>] [--rate=<r>] [--latency=<ms>] [--throttle=<ratio>] [--pages=<n>]
+    TMDB_benchmark.py startup [--films=<n>] [--dir=<path>] [--repeat=<n>]
+    TMDB_benchmark.py server [--port=<n>] [--latency=<ms>] [--throttle=<ratio>] [--pages=<n>]
+    TMDB_benchmark.py  (-h | --help)
+
+Options:
+   -h --help               Get help.
+  --films=<n>              Number of films of the synthetic tree (default : 50000 for memory, 5000 for memory --resolve,
+                           2000 for run, 200 for startup).
+  --resolve                The films of memory are searched on the local TMDB instead of having their sheets.
+  --dir=<path>             Directory of the synthetic tree, kept after the run (a temporary directory by default).
+  --workers=<n>            --workers of TMDB_fetcher.py  [default: 8]
+  --rate=<r>               --rate of TMDB_fetcher.py (max requests per second)  [default: 20]
+  --latency=<ms>           Delay of each answer of the local TMDB  [default: 50]
+  --throttle=<ratio>       Ratio of the requests answered by HTTP 429 (Too Many Requests)  [default: 0]
+  --pages=<n>              Pages of search results, the film is on the last one  [default: 1]
+  --port=<n>               Port of the local TMDB  [default: 8765]
+  --repeat=<n>             Runs of each mode, the median is given  [default: 5]
+
+
+Example:
+  python TMDB_benchmark.py memory
+  python TMDB_benchmark.py memory --resolve --workers=4
+  python TMDB_benchmark.py run --films=5000 --workers=8 --rate=40 --latency=80 --throttle=0.02
+  python TMDB_benchmark.py startup --repeat=9
+  python TMDB_benchmark.py server --port=8765
+  set TMDB_API_URL=http://127.0.0.1:8765/3 & set TMDB_IMAGE_URL=http://127.0.0.1:8765/t/p/w400 & python TMDB_fetcher.py "E:\\Videos" --key=bench
+
+"""
+
+from docopt import docopt  # pip install docopt
+import os
+import sys
+import time
+import json
+import random
+import shutil
+import tempfile
+import tracemalloc
+import logging
+import threading
+import subprocess
+import zlib
+import http.server
+import urllib.parse
+
+import TMDB_fetcher
+
+FILMS_PER_DIR = 100
+WORDS = ["amour", "nuit", "soleil", "guerre", "ville", "retour", "dernier", "secret", "maison", "voyage",
+         "ombre", "coeur", "mer", "train", "jardin", "roi", "homme", "femme", "enfants", "paradis",
+         "lost", "city", "night", "river", "dark", "king", "blue", "road", "star", "winter"]
+
+
+class MockTMDB(http.server.ThreadingHTTPServer):
+    """ Local stand-in of TMDB : search (the searched film on the last of the result pages), details with
+        credits appended, credits and posters (with an ETag).
+        latency : delay of each answer in s, throttle : ratio of the requests answered by HTTP 429.
+        Counts the requests and the bytes sent, by kind of request."""
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.05, throttle=0.0, pages=1):
+        http.server.ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), MockTMDBHandler)
+        self.latency = latency
+        self.throttle = throttle
+        self.pages = max(1, pages)
+        self.lock = threading.Lock()
+        self.films = {}         # tmdb id => (title, year) of the films found by the searches
+        self.reset()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def reset(self):
+        with self.lock:
+            self.requests = {'search': 0, 'details': 0, 'credits': 0, 'image': 0, '429': 0}
+            self.bytesSent = 0
+
+    def counted(self, kind, size):
+        with self.lock:
+            self.requests[kind] += 1
+            self.bytesSent += size
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def filmId(self, title, year):
+        tmdbId = zlib.crc32("{}|{}".format(title.lower(), year).encode('utf-8')) % 10000000 + 1
+        with self.lock:
+            self.films[tmdbId] = (title, year)
+        return tmdbId
+
+    def search(self, query):
+        title = query['query'].strip()
+        year = query.get('year') or str(1930 + zlib.crc32(title.encode('utf-8')) % 90)
+        page = int(query.get('page', 1))
+        if page < self.pages:
+            results = [{'id': 90000000 + page * 100 + k, 'title': "Autre film {}".format(k), 'original_title': "Other {}".format(k),
+                        'release_date': "1975-01-01", 'overview': ""} for k in range(20)]
+        elif page == self.pages:
+            results = [{'id': self.filmId(title, year), 'title': title, 'original_title': title,
+                        'release_date': "{}-06-15".format(year), 'overview': "Synopsis de {}".format(title)}]
+        else:
+            results = []
+        return {'page': page, 'results': results, 'total_pages': self.pages, 'total_results': (self.pages - 1) * 20 + 1}
+
+    def credits(self, tmdbId):
+        return {'id': tmdbId,
+                'cast': [{'name': "Acteur {} {}".format(tmdbId, k), 'character': "Rôle {}".format(k)} for k in range(30)],
+                'crew': [{'name': "Réalisateur {}".format(tmdbId), 'job': 'Director'},
+                         {'name': "Scénariste {}".format(tmdbId), 'job': 'Screenplay'},
+                         {'name': "Compositeur {}".format(tmdbId), 'job': 'Original Music Composer'}]}
+
+    def details(self, tmdbId, query):
+        with self.lock:
+            title, year = self.films.get(tmdbId, ("Film {}".format(tmdbId), "2000"))
+        d = {'id': tmdbId, 'title': title, 'original_title': title, 'release_date': "{}-06-15".format(year),
+             'runtime': 90 + tmdbId % 60, 'overview': "Synopsis de {}. ".format(title) * 8, 'poster_path': "/{}.jpg".format(tmdbId),
+             'genres': [{'name': 'Drame'}, {'name': 'Comédie'}], 'production_countries': [{'name': 'France'}]}
+        if 'credits' in query.get('append_to_response', ''):
+            d['credits'] = self.credits(tmdbId)
+        return d
+
+
+class MockTMDBHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    POSTER = b'\xff\xd8\xff\xe0' + bytes(30000)
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, kind, status, body, contentType='application/json', headers={}):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+            self.server.counted(kind, len(body))
+        else:
+            self.server.counted(kind, 0)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        u = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(u.query))
+        if server.throttle and random.random() < server.throttle:
+            return self.answer('429', 429, b'{"status_code": 25}', headers={'Retry-After': '1'})
+        parts = u.path.strip('/').split('/')
+        if u.path.startswith('/t/p/'):
+            return self.answer('image', 200, MockTMDBHandler.POSTER, 'image/jpeg', {'ETag': '"poster"'})
+        if u.path.endswith('/search/movie'):
+            return self.answer('search', 200, json.dumps(server.search(query)).encode('utf-8'))
+        if len(parts) >= 3 and parts[1] == 'movie' and parts[2].isdigit():
+            if parts[-1] == 'credits':
+                return self.answer('credits', 200, json.dumps(server.credits(int(parts[2]))).encode('utf-8'))
+            return self.answer('details', 200, json.dumps(server.details(int(parts[2]), query)).encode('utf-8'))
+        self.answer('search', 404, b'{"status_code": 34}')
+
+
+def filmTitle(rnd):
+    return " ".join(rnd.choice(WORDS) for k in range(rnd.randint(1, 4))).capitalize()
+
+
+def buildTree(root, nbFilms, withSheets=False):
+    """ nbFilms movie files (empty), FILMS_PER_DIR per directory, with realistic names :
+        'Titre - 1999.mkv', 'Titre (1999).avi', 'Titre.1999.mp4', titles without year, copies of the same film
+        in other directories, second parts and TV series in _NOTMDB (not counted in nbFilms).
+        withSheets : each film already has its sheet (60 actors).
+        returns the paths of the films"""
+    rnd = random.Random(nbFilms)
+    films = []
+    titles = []
+    for i in range(nbFilms):
+        dirpath = os.path.join(root, "Films {:04d}".format(i // FILMS_PER_DIR))
+        if i % FILMS_PER_DIR == 0:
+            os.makedirs(dirpath, exist_ok=True)
+        if titles and rnd.random() < 0.03:     # the same film in another directory
+            title, year = rnd.choice(titles)
+        else:
+            title, year = "{} {}".format(filmTitle(rnd), i), 1930 + rnd.randrange(90)
+            titles.append((title, year))
+        style = rnd.random()
+        if style < 0.5:
+            fileName = "{} - {}.mkv".format(title, year)
+        elif style < 0.7:
+            fileName = "{} ({}).avi".format(title, year)
+        elif style < 0.9:
+            fileName = "{}.{}.mp4".format(title.replace(' ', '.'), year)
+        else:
+            fileName = "{}.mkv".format(title)
+        filePath = os.path.join(dirpath, fileName)
+        open(filePath, "w").close()
+        films.append(filePath)
+        if rnd.random() < 0.02:
+            open(os.path.join(dirpath, "{} - {} CD2{}.avi".format(title, year, TMDB_fetcher.DO_NOT_INDEX)), "w").close()
+        if withSheets:
+            with open(os.path.splitext(filePath)[0] + TMDB_fetcher.SHEET_SUFFIX, "w", encoding="utf-8") as f:
+                f.write(TMDB_fetcher.Film.formatNote({'Titre': title,
+                                                      'Chemin': filePath,
+                                                      'Année': year,
+                                                      'Acteurs': ["Acteur {} {}".format(i, k) for k in range(60)],
+                                                      'Genre': ['Drame', 'Comédie'],
+                                                      'Pays': ['France'],
+                                                      'Affiche': None,
+                                                      'Durée (mn)': 100,
+                                                      'Metteur en scène': ["Réalisateur {}".format(i)],
+                                                      'Auteur': ["Auteur {}".format(i)],
+                                                      'Musique': ["Compositeur {}".format(i)],
+                                                      'Synopsis': "Synopsis " * 60}))
+    series = os.path.join(root, "Series{}".format(TMDB_fetcher.DO_NOT_INDEX))
+    for season in range(1, 1 + max(1, nbFilms // 500)):
+        os.makedirs(os.path.join(series, "Saison {}".format(season)), exist_ok=True)
+        for episode in range(1, 11):
+            open(os.path.join(series, "Saison {}".format(season), "Episode S{:02d}E{:02d}.mkv".format(season, episode)), "w").close()
+    return films
+
+
+def benchMemory(root, nbFilms, resolve=False, workers=1):
+    """ resolve : the films have no sheet and are searched on a local TMDB, in this process
+        (the memory kept by the local TMDB is not counted)"""
+    print("Construction de l'arborescence : {} films dans '{}'".format(nbFilms, root))
+    buildTree(root, nbFilms, withSheets=not resolve)
+    TMDB_fetcher.LOGGER = logging.getLogger("TMDB_benchmark.py")
+    TMDB_fetcher.LOGGER.addHandler(logging.NullHandler())
+    TMDB_fetcher.LOGGER.propagate = False
+    TMDB_fetcher.MOVIE_CATALOG = os.path.join(root, TMDB_fetcher.CATALOG)
+    TMDB_fetcher.MOVIE_SHEETS = os.path.join(root, TMDB_fetcher.SHEETS)
+    if resolve:
+        server = MockTMDB(latency=0).start()
+        TMDB_fetcher.TMDB_API_URL = server.url + "/3"
+        TMDB_fetcher.TMDB_IMAGE_URL = server.url + "/t/p/w400"
+        TMDB_fetcher.RETRY_POLICY = TMDB_fetcher.RetryPolicy(TMDB_fetcher.RateLimiter(100000), 3)
+        TMDB_fetcher.MOVIE = TMDB_fetcher.MovieApi("bench", TMDB_fetcher.LANGUAGES[0], retryPolicy=TMDB_fetcher.RETRY_POLICY)
+        TMDB_fetcher.REVIEW = TMDB_fetcher.ReviewQueue(os.path.join(root, TMDB_fetcher.REVIEW_FILE))
+        TMDB_fetcher.DEFER = True
+        TMDB_fetcher.WORKERS = workers
+    tracemalloc.start()
+    start = time.perf_counter()
+    movieDB = TMDB_fetcher.MovieDB(root)
+    movieDB.lookForMovies()
+    peak = tracemalloc.get_traced_memory()[1]
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, __file__),
+                                                          tracemalloc.Filter(False, tracemalloc.__file__)])
+    retained = sum(stat.size for stat in snapshot.statistics('filename'))
+    movieDB.doBuildCatalog()
+    movieDB.doBuildMovieNotesFile()
+    duration = time.perf_counter() - start
+    tracemalloc.stop()
+    print("Films parcourus          : {}".format(len(movieDB.movieDB)))
+    if resolve:
+        server.shutdown()
+        print("Requêtes TMDB            : {} recherches, {} détails ; {} films à revoir".format(
+              server.requests['search'], server.requests['details'], len(TMDB_fetcher.REVIEW.pending())))
+    print("Durée                    : {:.1f} s".format(duration))
+    print("Mémoire gardée (fin)     : {:.1f} Mo ({:.0f} octets par film)".format(retained / 2**20, retained / max(1, nbFilms)))
+    print("Pic de mémoire           : {:.1f} Mo".format(peak / 2**20))
+
+
+def runFetcher(server, args, stderr=subprocess.DEVNULL, pythonOptions=()):
+    """ runs TMDB_fetcher.py with args, against the local TMDB
+        returns (duration in s, peak RSS in Mo or None if unknown on this system)"""
+    env = dict(os.environ, TMDB_API_URL=server.url + "/3", TMDB_IMAGE_URL=server.url + "/t/p/w400")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TMDB_fetcher.py")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + list(pythonOptions) + [script] + args, env=env,
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr)
+    if hasattr(os, 'wait4'):
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peakRSS = usage.ru_maxrss / 1024 if sys.platform != 'darwin' else usage.ru_maxrss / 2**20
+    else:
+        process.wait()
+        peakRSS = None
+    duration = time.perf_counter() - start
+    if process.returncode:
+        print("Attention : TMDB_fetcher.py {} a fini en erreur ({})".format(" ".join(args), process.returncode))
+    return duration, peakRSS
+
+
+def benchRun(root, nbFilms, workers, rate, latency, throttle, pages):
+    print("Construction de l'arborescence : {} films dans '{}'".format(nbFilms, root))
+    films = buildTree(root, nbFilms)
+    server = MockTMDB(latency=latency, throttle=throttle, pages=pages).start()
+    common = ["--key=bench", "--defer", "--workers={}".format(workers), "--rate={}".format(rate)]
+    singleFile = films[len(films) // 2]
+    scenarios = [("parcours complet", [root] + common),
+                 ("relance", [root] + common),
+                 ("--file", [root, "--file={}".format(singleFile)] + common),
+                 ("--cleanup", [root, "--cleanup"])]
+    print("TMDB local : {}, latence {:.0f} ms, 429 : {:.0%}, {} pages de résultats".format(server.url, latency * 1000, throttle, pages))
+    print("{:<18} {:>9} {:>10} {:>8} {:>8} {:>8} {:>7} {:>12} {:>10}".format(
+          "scénario", "durée (s)", "recherches", "détails", "générique", "affiches", "429", "Mo reçus", "RSS (Mo)"))
+    for name, args in scenarios:
+        if name == "--file" and not os.path.isfile(singleFile):     # renamed by the walk
+            singleFile = os.path.join(os.path.dirname(singleFile), [f for f in sorted(os.listdir(os.path.dirname(singleFile)))
+                                                                    if TMDB_fetcher.Film.isMovie(f, os.path.dirname(singleFile))][0])
+            args = [root, "--file={}".format(singleFile)] + common
+        server.reset()
+        duration, peakRSS = runFetcher(server, args)
+        r = server.requests
+        print("{:<18} {:>9.2f} {:>10} {:>8} {:>8} {:>8} {:>7} {:>12.2f} {:>10}".format(
+              name, duration, r['search'], r['details'], r['credits'], r['image'], r['429'], server.bytesSent / 2**20,
+              "{:.1f}".format(peakRSS) if peakRSS is not None else "n/a"))
+    cache = os.path.join(root, TMDB_fetcher.CACHE_FILE)
+    if os.path.isfile(cache):       # kept by --cleanup, the next run would not query TMDB
+        os.remove(cache)
+    server.shutdown()
+
+
+def importTimes(report):
+    """ (total import time in ms, modules imported) of a -X importtime report,
+        the total being the sum of the top level imports"""
+    total = 0
+    modules = set()
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        selfTime, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        if not name.startswith("  "):     # top level import
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def benchStartup(root, nbFilms, repeat):
+    """ cold start of each mode of TMDB_fetcher.py (median of repeat runs) : wall time, time spent in imports,
+        and whether the network modules were imported"""
+    print("Construction de l'arborescence : {} films dans '{}'".format(nbFilms, root))
+    films = buildTree(root, nbFilms)
+    server = MockTMDB(latency=0).start()
+    modes = [("--help", ["--help"]),
+             ("--cleanup --dry-run", [root, "--cleanup", "--dry-run"]),
+             ("--query", [root, "--query=annee>2000"]),
+             ("--offline --file", [root, "--offline", "--file={}".format(films[0])]),
+             ("--file", [root, "--key=bench", "--file={}".format(films[0])])]
+    print("{:<22} {:>10} {:>12} {:>8} {:>8}".format("mode", "durée (ms)", "imports (ms)", "modules", "réseau"))
+    for name, args in modes:
+        durations = []
+        imports = []
+        for k in range(repeat):
+            with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as report:
+                duration, peakRSS = runFetcher(server, args, stderr=report, pythonOptions=["-X", "importtime"])
+                report.seek(0)
+                importTime, modules = importTimes(report.read())
+            durations.append(duration * 1000)
+            imports.append(importTime)
+        print("{:<22} {:>10.0f} {:>12.1f} {:>8} {:>8}".format(name, sorted(durations)[repeat // 2], sorted(imports)[repeat // 2],
+              len(modules), "oui" if {'urllib.request', 'http.client'} & modules else "non"))
+        if name == "--file":     # the walk is not what is measured, --file is run again on the same film
+            films[0] = next((os.path.join(os.path.dirname(films[0]), f) for f in sorted(os.listdir(os.path.dirname(films[0])))
+                             if TMDB_fetcher.Film.isMovie(f, os.path.dirname(films[0]))), films[0])
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    arguments = docopt(__doc__)
+    try:
+        NB_FILMS = int(arguments['--films']) if arguments['--films'] else \
+                   (5000 if arguments['--resolve'] else 50000 if arguments['memory'] else 200 if arguments['startup'] else 2000)
+        REPEAT = max(1, int(arguments['--repeat']))
+        DIRPATH = arguments['--dir']
+        WORKERS = max(1, int(arguments['--workers']))
+        RATE = float(arguments['--rate'])
+        LATENCY = float(arguments['--latency']) / 1000
+        THROTTLE = float(arguments['--throttle'])
+        PAGES = max(1, int(arguments['--pages']))
+        PORT = int(arguments['--port'])
+    except ValueError:
+        print("ERROR: Incorrect parameters, use --help.")
+        exit(1)
+    if arguments['server']:
+        server = MockTMDB(PORT, LATENCY, THROTTLE, PAGES)
+        print("TMDB local : {}/3 (affiches : {}/t/p/w400), Ctrl-C pour arrêter".format(server.url, server.url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        exit(0)
+    root = DIRPATH or tempfile.mkdtemp(prefix="tmdb_bench_")
+    if DIRPATH:
+        os.makedirs(root, exist_ok=True)
+    try:
+        if arguments['memory']:
+            benchMemory(root, NB_FILMS, arguments['--resolve'], WORKERS)
+        elif arguments['startup']:
+            benchStartup(root, NB_FILMS, REPEAT)
+        elif arguments['run']:
+            benchRun(root, NB_FILMS, WORKERS, RATE, LATENCY, THROTTLE, PAGES)
+    finally:
+        if not DIRPATH:
+            shutil.rmtree(root, ignore_errors=True)
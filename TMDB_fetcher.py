@@ -8,6 +8,9 @@ La note aura le même nom que le film, avec une extensions  _imdb.txt .
 Le film sera renommé en fonction du titre exact trouvé dans la base et de l'année de sa sortie.
 L'affiche correspondant au film sera également téléchargée.
 Les titres et notes d'information sont en Français.
+L'option --languages=fr,en ajoute des fiches dans d'autres langues (film_tmdb.en.txt), avec leur catalogue et leur
+fichier des fiches (___CATALOGUE_FILMS.en.TXT...) : le film n'est recherché qu'une fois, dans la première langue,
+et chaque autre langue ne coûte qu'une requête, envoyée en même temps (acteurs et affiche sont repris).
 Un catalogue de tous les films trouvés  sera établi à la racine du dossier (MOVIE_CATALOG.TXT). 
 
 Important : Une clé doit avoir été obtenue du site TMDB en créant un compte sur https://www.themoviedb.org/account/signup.
@@ -15,7 +18,34 @@ Important : Une clé doit avoir été obtenue du site TMDB en créant un compte
 En cas d'ajout de nouveaux films, l'outil peut être relancé, les films déjà traités ne seront pas modifiés, seuls les nouveaux films seront recherchés.
 On peut également effacter toutes les informations et recommencer avec l'option --cleanup.
 Enfin, on peut ne chercher les informations que pour un seul fichier avec l'option --file 
-(dans ce cas, les informations existantes seront remplacées pour ce film).
+(dans ce cas, les informations existantes seront remplacées pour ce film, une fois les nouvelles obtenues).
+L'option --file peut être répétée ou contenir un motif (*.mkv), et --files-from donne une liste de fichiers :
+les films sont alors recherchés en parallèle (--workers) et le catalogue mis à jour en une seule fois.
+Les réponses de TMDB sont conservées dans un cache (__TMDB_CACHE.DB, non effacé par --cleanup) : une reconstruction
+n'interroge plus TMDB pour les films déjà trouvés. L'option --offline n'utilise que ce cache.
+Avec l'option --defer, les films ambigus ou inconnus ne bloquent pas le traitement : ils sont mis en attente
+(__TMDB_A_REVOIR.TXT) et l'option --review permet ensuite de faire tous les choix en une seule fois.
+Si le traitement est interrompu, l'option --resume le reprend là où il s'était arrêté (journal __TMDB_JOURNAL.TXT).
+Un index du parcours (__TMDB_SCAN.DB) permet, lors d'une relance, de ne ré-examiner que les dossiers et fichiers modifiés
+(option --rescan pour tout ré-examiner).
+Les dossiers sont listés par plusieurs threads (--scanWorkers) pendant que les films déjà trouvés sont recherchés,
+et les dossiers _NOTMDB ne sont pas parcourus.
+L'option --stats écrit un rapport des durées de chaque étape (parcours, requêtes TMDB, fiches, affiches, catalogue)
+dans __TMDB_STATS.JSON, et l'option --profile profile le traitement avec cProfile (__TMDB_PROFILE.PSTATS).
+Avec l'option --store, les films sont aussi gardés dans une base (__TMDB_FILMS.DB) : l'option --query y recherche
+des films (par titre, année, durée, acteur, réalisateur, auteur, musique, genre ou pays) et l'option --export
+régénère le catalogue, le fichier des fiches et les fiches à partir de cette base.
+L'option --rebuild régénère le catalogue et le fichier des fiches à partir des fiches existantes, sans interroger TMDB
+(après un déplacement de la bibliothèque, le chemin des fiches est corrigé).
+Pour répartir une grande bibliothèque sur plusieurs machines, chacune traite avec l'option --shard=k/n une partie
+des dossiers (ou un sous-dossier avec --shard=1/1) et écrit des fragments triés du catalogue et du fichier des fiches
+(___CATALOGUE_FILMS.k-n.TXT, ___FICHES_FILMS.k-n.TXT) ; l'option --merge les fusionne ensuite, sans tout charger en
+mémoire ni interroger TMDB, en un catalogue et un fichier des fiches globaux (triés par chemin).
+Avec l'option --watch, l'outil continue après le parcours à surveiller l'arborescence : les nouveaux films sont
+recherchés dès que leur copie est terminée (--debounce), les films supprimés sont retirés du catalogue et du
+fichier des fiches, qui sont mis à jour sans être régénérés (arrêt par Ctrl-C).
+L'option --workers permet d'interroger TMDB pour plusieurs films en parallèle (les questions à l'opérateur
+restent posées une par une, et le catalogue garde le même ordre).
         
 This tool allows for walking through a directory tree containing movie files and to query the TMDB movie database
 in order to establish a note describing each found movie.
@@ -40,36 +70,81 @@ Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International License
 
 
 Usage:
-    TMDB_fetcher.py <rootDirPath> --key=<TMDB_KEY>   [--verbose] 
-    TMDB_fetcher.py <rootDirPath> --key=<TMDB_KEY>   --file=<filePath> [--verbose] 
-    TMDB_fetcher.py <rootDirPath> --cleanup [--verbose] 
+    TMDB_fetcher.py <rootDirPath> --key=<TMDB_KEY>   [options] 
+    TMDB_fetcher.py <rootDirPath> --key=<TMDB_KEY>   (--file=<filePath> | --files-from=<listPath>)... [options] 
+    TMDB_fetcher.py <rootDirPath> --key=<TMDB_KEY>   --review [options] 
+    TMDB_fetcher.py <rootDirPath> --offline [(--file=<filePath> | --files-from=<listPath>)...] [options] 
+    TMDB_fetcher.py <rootDirPath> --query=<query> [options] 
+    TMDB_fetcher.py <rootDirPath> --export [options] 
+    TMDB_fetcher.py <rootDirPath> --merge=<fragment>... [options] 
+    TMDB_fetcher.py <rootDirPath> --rebuild [options] 
+    TMDB_fetcher.py <rootDirPath> --cleanup [options] 
     TMDB_fetcher.py  (-h | --help)
 
 Options:
    -h --help               Get help.
   --version                Get this program version.
   --key=<key>              Key provided by TMDBapi.com, see http://www.TMDBapi.com/apikey.aspx
-  --file="<path to file>"  To handle a single file.
+  --file="<path to file>"  To handle a single file, can be repeated or be a pattern ("D:\Films\*.mkv", "**" for all sub directories).
+  --files-from=<listPath>  To handle the files listed in a text file, one path or pattern per line (can be repeated).
+  --languages=<list>       Languages of the sheets, the first one is used for the searches, the file names and the main files,
+                           the other ones have their own sheets (_tmdb.en.txt), catalog and notes file  [default: fr]
+  --workers=<n>            Number of films looked up on TMDB at the same time  [default: 1]
+  --cacheDays=<n>          Days during which the TMDB answers are kept in the cache  [default: 30]
+  --cacheSize=<Mo>         Max size of the TMDB answers cache (__TMDB_CACHE.DB), in Mo  [default: 200]
+  --offline                Only uses the TMDB answers cache, TMDB is not queried.
+  --rate=<r>               Max number of requests per second sent to TMDB  [default: 20]
+  --retries=<n>            Number of retries of a failed or throttled request (HTTP 429)  [default: 5]
+  --posterWorkers=<n>      Number of posters downloaded at the same time  [default: 4]
+  --scanWorkers=<n>        Number of directories listed at the same time  [default: 8]
+  --rescan                 Ignores the scan index (__TMDB_SCAN.DB) and examines again all the directories and sheets.
+  --resume                 Resumes an interrupted walk from its journal (__TMDB_JOURNAL.TXT).
+  --defer                  Does not ask the operator during the walk : ambiguous or unknown films are put in a review queue (__TMDB_A_REVOIR.TXT).
+  --review                 Asks the operator the choices of the review queue, without searching TMDB again.
+  --store                  Keeps the films in a queryable database (__TMDB_FILMS.DB).
+  --query=<query>          Prints the films of the database matching the query, e.g. "realisateur:Eastwood annee>1990".
+  --export                 Generates again the catalog, the notes file and the sheets from the database.
+  --stats                  Writes a report of the run (timings of the phases, counters) in __TMDB_STATS.JSON.
+  --shard=<k/n>            Only handles the films of the k-th of n partitions of the tree (by a hash of their directory), and writes
+                           sorted fragments of the catalog and of the notes file (___CATALOGUE_FILMS.k-n.TXT...), to be merged.
+  --merge=<fragment>       Builds the catalog and the notes file from catalog fragments of shards (can be repeated or be a pattern).
+  --rebuild                Generates again the catalog and the notes file from the existing sheets, without TMDB,
+                           and corrects the path (Chemin) of the sheets of the moved films.
+  --watch                  After the walk, keeps watching the tree and handles the new, renamed or removed films (Ctrl-C to stop).
+  --interval=<s>           With --watch, seconds between two checks of the directories  [default: 5]
+  --debounce=<s>           With --watch, seconds during which a new file must not change before being handled  [default: 10]
+  --profile                Profiles the run with cProfile in __TMDB_PROFILE.PSTATS (main thread only : use --workers=1 to see all).
   --verbose                Prints all informations got from TMDB  
   --cleanup                Removes all files generated by this tool.
+  --dry-run                With --cleanup, only counts the files to remove and their size.
   
   
 Example:
   python TMDB_fetcher.py "E:\Videos" -k=abcdef 
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --workers=8
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --workers=8 --languages=fr,en
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --workers=8 --defer
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --review
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --workers=4 --defer --watch
   python TMDB_fetcher.py "D:\" -k=abcdef --file="D:\Avatar.mp4"
+  python TMDB_fetcher.py "D:\" -k=abcdef --file="D:\Avatar.mp4" --file="D:\Films\*.mkv" --workers=8
+  python TMDB_fetcher.py "D:\" -k=abcdef --files-from="D:\liste.txt"
+  python TMDB_fetcher.py "E:\Videos" --offline
+  python TMDB_fetcher.py "E:\Videos" -k=abcdef --store
+  python TMDB_fetcher.py "E:\Videos" --query="acteur:'Jean Gabin' genre:Drame annee<1960"
+  python TMDB_fetcher.py "N:\Films" -k=abcdef --shard=2/3
+  python TMDB_fetcher.py "N:\Films" --merge="N:\Films\___CATALOGUE_FILMS.*-3.TXT"
+  python TMDB_fetcher.py "E:\Videos" --rebuild
   python TMDB_fetcher.py "E:\Videos" --cleanup
+  python TMDB_fetcher.py "E:\Videos" --cleanup --dry-run
   
 """
-# TMDB API, see : https://pypi.org/project/tmdbv3api/
+# TMDB API, see : https://developers.themoviedb.org/3/getting-started/introduction
 # see the json schemas here :  https://developers.themoviedb.org/3/movies/get-movie-details
 
-from tmdbv3api import TMDb  # $ pip install tmdbv3api
-TMDB = TMDb()
-from tmdbv3api import Movie
-MOVIE = Movie()
-
+# the modules needed by some modes only (network, SQLite, profiling...) are imported where they are used,
+# so that --help, --cleanup or --offline start faster
 import json
-import argparse
 from docopt import docopt  # pip install docopt
 import os
 import sys
@@ -77,7 +152,20 @@ import re
 import textwrap
 import logging
 import datetime
-import wget # pip install wget
+import collections
+import threading
+import concurrent.futures
+import time
+import urllib.parse
+import urllib.error
+import random
+import shutil
+import unicodedata
+import io
+import functools
+import contextlib
+import heapq
+import zlib
 
 
 VERSION = 1.0
@@ -85,80 +173,1013 @@ LOG_FILE = "__TMDB_FETCHER.LOG"
 CATALOG = "___CATALOGUE_FILMS.TXT"
 SHEETS = "___FICHES_FILMS.TXT"
 SHEET_SUFFIX = '_tmdb.txt'
+CACHE_FILE = "__TMDB_CACHE.DB"
+SCAN_INDEX = "__TMDB_SCAN.DB"
+FILM_STORE = "__TMDB_FILMS.DB"
+NOTE_FIELDS = ['Titre', 'Chemin', 'Année', 'Acteurs', 'Genre', 'Pays', 'Affiche', 'Durée (mn)',
+               'Metteur en scène', 'Auteur', 'Musique', 'Synopsis']
+NOTE_LISTS = {'Acteurs', 'Genre', 'Pays', 'Metteur en scène', 'Auteur', 'Musique'}
+JOURNAL_FILE = "__TMDB_JOURNAL.TXT"
+REVIEW_FILE = "__TMDB_A_REVOIR.TXT"
+STATS_FILE = "__TMDB_STATS.JSON"
+PROFILE_FILE = "__TMDB_PROFILE.PSTATS"
+# can be redirected to a local stand-in of TMDB (see TMDB_benchmark.py)
+TMDB_API_URL = os.environ.get("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_IMAGE_URL = os.environ.get("TMDB_IMAGE_URL", "http://image.tmdb.org/t/p/w400")
+WORKERS = 1
+SCAN_WORKERS = 8
+MOVIE = None   # MovieApi instance, built in __main__
+RETRY_POLICY = None   # RetryPolicy shared by all the HTTP requests, built in __main__
+POSTERS = None   # PosterDownloader, built in __main__ (None in offline mode)
+INDEX = None   # ScanIndex, built in __main__
+JOURNAL = None   # Journal of the walk, built in __main__
+STORE = None   # FilmStore, built in __main__ with --store
+LANGUAGES = ['fr']   # --languages : the first one is used for the searches, the file names and the main files
+TRANSLATIONS = None   # pool of the requests of the other languages, built in __main__ with several languages
+SHARD = None   # (k, n) with --shard=k/n : only the films of the k-th of n hash partitions are handled
+REVIEW = None   # ReviewQueue, built in __main__ ; when DEFER, the operator is not asked during the walk
+DEFER = False
+MATCH_THRESHOLD = 0.85   # min score of a TMDB result to be selected without asking the operator
+YEAR_TOLERANCE = 1       # years of difference accepted between the file name and TMDB
+SHARED_RESULTS = 256     # results kept by SEARCHES and DETAILS for the copies of a film, most recently used
+CONSOLE_LOCK = threading.RLock()   # only one question to the operator at a time
 POSTER_SUFFIX = '_tmdb'
+POSTER_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+CLEANUP_BATCH = 256     # files removed by a thread at a time
+REBUILD_BATCH = 64     # sheets read by a thread at a time with --rebuild
 DO_NOT_INDEX = '_NOTMDB'
+MOVIE_EXTENSIONS = {'.avi', '.mp4', '.mpg', '.mpeg', '.mkv'}
+
+
+
+class TMDBError(Exception):
+    "raised when TMDB cannot give an answer"
+    
+class OfflineError(TMDBError):
+    "raised in offline mode when the answer is not in the cache"
+    
+class TMDBObj(dict):
+    "json object returned by TMDB, fields can be read as attributes : film.title"
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class RunStats:
+    """ Counters and latency histograms of the phases of the run (walk, TMDB requests, sheets, posters, files),
+        collected by all the threads, written as a JSON report with --stats."""
+    BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]     # upper bounds of the histogram buckets, in s
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.phases = {}      # phase => [count, total, max, counts by bucket]
+        self.counters = collections.Counter()
+        
+    def record(self, phase, duration):
+        with self.lock:
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = [0, 0.0, 0.0, [0] * (len(RunStats.BUCKETS) + 1)]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+            stats[3][next((i for i, bound in enumerate(RunStats.BUCKETS) if duration <= bound), len(RunStats.BUCKETS))] += 1
+            
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+        
+    @contextlib.contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+            
+    def report(self):
+        labels = ["<={}ms".format(int(bound * 1000)) for bound in RunStats.BUCKETS] + [">{}ms".format(int(RunStats.BUCKETS[-1] * 1000))]
+        with self.lock:
+            return {'duration': round(time.perf_counter() - self.start, 3),
+                    'phases': {phase: {'count': count, 'total': round(total, 3), 'mean': round(total / count, 6),
+                                       'max': round(longest, 3), 'histogram': dict(zip(labels, buckets))}
+                               for phase, (count, total, longest, buckets) in sorted(self.phases.items())},
+                    'counters': dict(sorted(self.counters.items()))}
+    
+    def save(self, path, **details):
+        "writes the report, completed with details (version, arguments...)"
+        report = dict(details, **self.report())
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, ensure_ascii=False)
+        
+STATS = RunStats()
+
+
+def timedPhase(phase):
+    "decorator : the calls of the function are timed as a phase of STATS"
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with STATS.timed(phase):
+                return function(*args, **kwargs)
+        return timed
+    return decorate
+
+
+class ResponseCache:
+    """ Persistent cache of the TMDB answers, stored in a SQLite file at the root of the tree.
+        Entries expire after ttlDays; when the file grows beyond maxSizeMo, the least recently used
+        entries are evicted. The times of the hits are kept in memory and written in batches."""
+    USED_BATCH = 1000
+    
+    def __init__(self, path, ttlDays, maxSizeMo):
+        self.filePath = path
+        self.ttl = ttlDays * 24 * 3600
+        self.maxSize = maxSizeMo * 1024 * 1024
+        self.lock = threading.Lock()
+        self.used = {}     # key => time of its last hit, not written yet
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT, stored REAL, used REAL, size INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        
+    def get(self, key, ignoreTTL=False):
+        "returns the cached body or None"
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT body, stored FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not ignoreTTL and now - row[1] > self.ttl:
+                return None
+            self.used[key] = now
+            if len(self.used) >= ResponseCache.USED_BATCH:
+                self.flushUsed()
+                self.db.commit()
+        return row[0]
+    
+    def flushUsed(self):
+        "writes the times of the hits kept in memory (lock held, the caller commits)"
+        if self.used:
+            self.db.executemany("UPDATE responses SET used=? WHERE key=?", [(t, key) for key, t in self.used.items()])
+            self.used = {}
+    
+    def put(self, key, body):
+        now = time.time()
+        size = len(key) + len(body)
+        with self.lock:
+            row = self.db.execute("SELECT size FROM responses WHERE key=?", (key,)).fetchone()
+            if row:
+                self.size -= row[0]
+            self.flushUsed()     # the eviction orders the entries by their last use
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, body, now, now, size))
+            self.size += size
+            if self.size > self.maxSize:
+                self.evict()
+            self.db.commit()
+            
+    def evict(self):
+        "removes the least recently used entries until the cache is back to 90% of its max size (lock held)"
+        global LOGGER
+        target = self.maxSize * 0.9
+        evicted = 0
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            if self.size <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE key=?", (key,))
+            self.size -= size
+            evicted += 1
+        LOGGER.debug("Cache : {} réponses supprimées".format(evicted))
+        
+    def close(self):
+        with self.lock:
+            self.flushUsed()
+            self.db.commit()
+            self.db.close()
+
+class RateLimiter:
+    """ Token bucket shared by all the threads : at most `rate` requests per second on average,
+        with bursts of up to `rate` requests."""
+    def __init__(self, rate):
+        self.rate = max(rate, 0.1)
+        self.capacity = max(rate, 1)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+        
+    def acquire(self):
+        "waits until a request may be sent"
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class RetryPolicy:
+    """ Sends the HTTP requests through the RateLimiter and retries them, with exponential backoff and jitter,
+        when they are throttled (HTTP 429), when the server fails (HTTP 5xx) or when the network fails.
+        The delay asked by the server (Retry-After) is respected."""
+    def __init__(self, limiter, retries, baseDelay=1.0, maxDelay=60.0):
+        self.limiter = limiter
+        self.retries = retries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        
+    def backoff(self, attempt):
+        delay = min(self.maxDelay, self.baseDelay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+        
+    def run(self, action, description):
+        """ returns action(), raises TMDBError when all the attempts failed"""
+        global LOGGER
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                return action()
+            except urllib.error.HTTPError as e:
+                if e.code != 429 and e.code < 500:
+                    raise TMDBError("Echec de la requête {} : {}".format(description, e))
+                error = e
+                retryAfter = e.headers.get('Retry-After') if e.headers else None
+                delay = float(retryAfter) if retryAfter and retryAfter.isdigit() else self.backoff(attempt)
+            except OSError as e:     # URLError, timeouts, connection reset
+                error = e
+                delay = self.backoff(attempt)
+            if attempt >= self.retries:
+                raise TMDBError("Echec de la requête {} après {} essais : {}".format(description, attempt+1, error))
+            LOGGER.warning("Requête {} : {}, nouvel essai dans {:.1f}s".format(description, error, delay))
+            time.sleep(delay)
+            attempt += 1
+
+class MovieApi:
+    """ The TMDB movie requests used by this tool (search, details, credits).
+        The answers go through the ResponseCache, keyed by endpoint, parameters and language.
+        In offline mode, only the cache is used (expired entries included)."""
+    def __init__(self, key, language, cache=None, offline=False, retryPolicy=None):
+        self.key = key
+        self.language = language
+        self.retryPolicy = retryPolicy
+        self.cache = cache
+        self.offline = offline
+        self.counter = threading.local()   # requests sent to TMDB by the current thread
+        
+    def callCount(self):
+        "number of requests sent to TMDB (cache hits excluded) by the current thread"
+        return getattr(self.counter, 'calls', 0)
+        
+    def request(self, endpoint, **params):
+        global LOGGER
+        params['language'] = params.get('language') or self.language
+        cacheKey = endpoint + '?' + urllib.parse.urlencode(sorted(params.items()))
+        if self.cache:
+            body = self.cache.get(cacheKey, ignoreTTL=self.offline)
+            if body is not None:
+                try:
+                    answer = json.loads(body, object_hook=TMDBObj)
+                    STATS.count('tmdbCacheHits')
+                    return answer
+                except ValueError:
+                    LOGGER.warning("Réponse illisible dans le cache : {}".format(cacheKey))
+        if self.offline:
+            raise OfflineError("Absent du cache : {}".format(cacheKey))
+        url = TMDB_API_URL + endpoint + '?' + urllib.parse.urlencode(dict(params, api_key=self.key))
+        
+        def fetch():
+            "the answer is read and decoded in the attempt : a truncated answer is retried"
+            import urllib.request
+            import http.client
+            self.counter.calls = self.callCount() + 1
+            STATS.count('tmdbAttempts')
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    body = response.read().decode('utf-8')
+                return body, json.loads(body, object_hook=TMDBObj)
+            except (http.client.HTTPException, ValueError) as e:     # IncompleteRead, invalid json
+                raise ConnectionError("Réponse incomplète ou illisible : {!r}".format(e))
+        with STATS.timed('tmdbRequest'):
+            body, answer = self.retryPolicy.run(fetch, cacheKey)
+        STATS.count('tmdbRequests')
+        STATS.count('tmdbBytes', len(body))
+        if self.cache:
+            self.cache.put(cacheKey, body)
+        return answer
+    
+    @timedPhase('searchPage')
+    def search(self, term, page=1, year=None):
+        """ the candidates only keep the fields used to choose a film (they are kept by SEARCHES and the review queue)"""
+        if year:
+            results = self.request('/search/movie', query=term, page=page, year=year)['results']
+        else:
+            results = self.request('/search/movie', query=term, page=page)['results']
+        return [TMDBObj(id=r['id'], title=r.get('title') or '', original_title=r.get('original_title') or '',
+                        release_date=r.get('release_date') or '', overview=(r.get('overview') or '')[:80]) for r in results]
+    
+    @timedPhase('details')
+    def details(self, tmdbId, append=None, language=None):
+        """ append : comma separated sub-requests returned with the details (append_to_response), e.g. 'credits'
+            language : instead of the language of the client
+            Only the fields of the sheets are kept, the lists as names (the details are kept by DETAILS for the copies of the film) :
+            genres, production_countries and, with the credits, credits.cast, .directors, .writers and .music"""
+        if append:
+            details = self.request('/movie/{}'.format(tmdbId), append_to_response=append, language=language)
+        else:
+            details = self.request('/movie/{}'.format(tmdbId), language=language)
+        compact = TMDBObj((field, details.get(field)) for field in ('id', 'title', 'release_date', 'runtime', 'overview', 'poster_path'))
+        compact['genres'] = [g['name'] for g in details.get('genres') or []]
+        compact['production_countries'] = [c['name'] for c in details.get('production_countries') or []]
+        if 'credits' in details:
+            crew = details.credits.get('crew') or []
+            compact['credits'] = TMDBObj(cast=[a['name'] for a in details.credits.get('cast') or []],
+                                         directors=[d['name'] for d in crew if d['job']=="Director"],
+                                         writers=[d['name'] for d in crew if d['job']=="Screenplay"],
+                                         music=[d['name'] for d in crew if "Music" in d['job']])
+        return compact
+    
 
+class PosterDownloader:
+    """ Downloads the posters in a bounded pool of threads, while the next films are being resolved.
+        Each thread keeps its connection to the image server alive from one poster to the next.
+        A poster is written to a temporary file then renamed, and is not downloaded again when the local
+        file already has the size or the ETag announced by the server (ETags are kept in the ResponseCache)."""
+    def __init__(self, workers, retryPolicy, cache=None):
+        self.retryPolicy = retryPolicy
+        self.cache = cache
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.connections = threading.local()
+        
+    def submit(self, url, posterPath):
+        "queues the download ; no future is kept, download() logs its own errors"
+        self.pool.submit(self.download, url, posterPath)
+        
+    def close(self):
+        "waits for the pending downloads"
+        self.pool.shutdown(wait=True)
+        
+    def connection(self, scheme, host):
+        "connection of the current thread to this host, created once and then reused"
+        if not hasattr(self.connections, 'byHost'):
+            self.connections.byHost = {}
+        conn = self.connections.byHost.get((scheme, host))
+        if conn is None:
+            import http.client
+            connClass = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connClass(host, timeout=30)
+            self.connections.byHost[(scheme, host)] = conn
+        return conn
+        
+    def request(self, method, url, redirects=3):
+        "returns (headers, body) of the answer, follows redirections, raises HTTPError or OSError"
+        import http.client
+        u = urllib.parse.urlsplit(url)
+        conn = self.connection(u.scheme, u.netloc)
+        try:
+            conn.request(method, u.path + ('?' + u.query if u.query else ''))
+            response = conn.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()    # will reconnect at next request
+            del self.connections.byHost[(u.scheme, u.netloc)]
+            raise ConnectionError(str(e))
+        if response.status in (301, 302, 303, 307, 308) and redirects > 0:
+            return self.request(method, urllib.parse.urljoin(url, response.getheader('Location')), redirects - 1)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response.headers, body
+    
+    @timedPhase('posterDownload')
+    def download(self, url, posterPath):
+        global LOGGER
+        etagKey = 'etag:' + posterPath
+        try:
+            if os.path.isfile(posterPath):
+                headers, body = self.retryPolicy.run(lambda: self.request('HEAD', url), url)
+                etag = headers.get('ETag')
+                length = headers.get('Content-Length')
+                if (length and int(length) == os.path.getsize(posterPath)) or \
+                   (etag and self.cache and self.cache.get(etagKey, ignoreTTL=True) == etag):
+                    LOGGER.info("Affiche déjà à jour : {}".format(posterPath))
+                    STATS.count('postersUpToDate')
+                    return
+            headers, body = self.retryPolicy.run(lambda: self.request('GET', url), url)
+            tmpPath = posterPath + '.part'
+            with open(tmpPath, 'wb') as fh:
+                fh.write(body)
+            os.replace(tmpPath, posterPath)
+            if self.cache and headers.get('ETag'):
+                self.cache.put(etagKey, headers.get('ETag'))
+            LOGGER.info("Affiche téléchargée : {}".format(posterPath))
+            STATS.count('postersDownloaded')
+            STATS.count('posterBytes', len(body))
+        except (TMDBError, OSError) as e:
+            LOGGER.warning("Echec de téléchargement: {} : {}".format(url, e)) 
+        except Exception as e:
+            LOGGER.error("Erreur pendant le téléchargement de {} : {!r}".format(url, e))
+    
+
+class ScanIndex:
+    """ Persistent index of the scanned tree, stored in a SQLite file at the root of the tree.
+        For each directory : its mtime, its sub directories and its movie files.
+        For each film : size, mtime, TMDB id and the fields of its sheet.
+        On a rerun, a directory whose mtime did not change is not listed again and its films are taken
+        from the index without reading their sheets ; in a changed directory, only new or modified files are examined."""
+    def __init__(self, path):
+        self.filePath = path
+        self.lock = threading.Lock()
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=MEMORY")    # no journal file created in the root directory, which would change its mtime
+        self.db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, subdirs TEXT, movies TEXT)")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS films (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime INTEGER,
+                           tmdbId INTEGER, title TEXT, year TEXT, poster TEXT, note TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS films_dir ON films (dir)")
+        self.db.commit()
+        self.scannedDirs = {}     # directories listed during this run, saved by commit()
+        self.visitedDirs = set()
+        
+    def getDir(self, dirpath, mtime):
+        "returns (subdirs, movies) if the directory did not change since the last scan, else None"
+        self.visitedDirs.add(dirpath)
+        with self.lock:
+            row = self.db.execute("SELECT subdirs, movies FROM dirs WHERE path=? AND mtime=?", (dirpath, mtime)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row['subdirs']), json.loads(row['movies'])
+    
+    def scanned(self, dirpath, subdirs, movies):
+        "the directory was listed again, it will be saved by commit()"
+        self.scannedDirs[dirpath] = (subdirs, movies)
+        self.visitedDirs.add(dirpath)
+        
+    def dirs(self):
+        "{directory : (mtime, sub directories, movies)} of all the directories of the index"
+        with self.lock:
+            return {row['path']: (row['mtime'], json.loads(row['subdirs']), json.loads(row['movies']))
+                    for row in self.db.execute("SELECT * FROM dirs")}
+        
+    def getFilms(self, dirpath):
+        "index entries of the films of a directory, by path"
+        with self.lock:
+            return {row['path']: row for row in self.db.execute("SELECT * FROM films WHERE dir=?", (dirpath,))}
+    
+    def putFilm(self, film):
+        try:
+            st = os.stat(film.filePath)
+        except OSError:
+            return
+        with self.lock:
+            listing = self.scannedDirs.get(os.path.dirname(film.filePath))
+            if listing and film.originalPath != film.filePath:     # renamed : the listing to save follows the new name
+                movies = listing[1]
+                oldName = os.path.basename(film.originalPath)
+                if oldName in movies:
+                    movies.remove(oldName)
+                if os.path.basename(film.filePath) not in movies:
+                    movies.append(os.path.basename(film.filePath))
+                    movies.sort()
+            self.db.execute("INSERT OR REPLACE INTO films VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (film.filePath, os.path.dirname(film.filePath), st.st_size, st.st_mtime_ns,
+                             film.tmdbId, film.filmName, film.filmYear, film.poster, film.note))
+                             
+    def commit(self, fullWalk=False):
+        """ saves the directories listed during this run, with their mtime after the run (sheets and posters written).
+            After a walk of the whole tree, the directories which were not visited are removed."""
+        with self.lock:
+            for dirpath, (subdirs, movies) in self.scannedDirs.items():
+                try:
+                    mtime = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    continue
+                self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", (dirpath, mtime, json.dumps(subdirs), json.dumps(movies)))
+                for row in self.db.execute("SELECT path FROM films WHERE dir=?", (dirpath,)).fetchall():
+                    if os.path.basename(row['path']) not in movies:
+                        self.db.execute("DELETE FROM films WHERE path=?", (row['path'],))
+            if fullWalk:
+                for row in self.db.execute("SELECT path FROM dirs").fetchall():
+                    if row['path'] not in self.visitedDirs:
+                        self.db.execute("DELETE FROM dirs WHERE path=?", (row['path'],))
+                        self.db.execute("DELETE FROM films WHERE dir=?", (row['path'],))
+            self.db.commit()
+            self.scannedDirs = {}
+            
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class Journal:
+    """ Checkpoint log of a walk, at the root of the tree : one json line per film found, in the walk order,
+        and one line per sub tree whose films are all logged.
+        After an interruption, --resume takes the films back from the journal without querying TMDB,
+        and does not walk again the completed sub trees. The journal is removed at the end of a complete walk."""
+    def __init__(self, path, resume):
+        global LOGGER
+        self.filePath = path
+        self.films = {}         # path => entry of the film taken back from the journal, until it is walked again
+        self.logged = set()     # paths of the films logged, their entries are not kept
+        self.subtrees = {}      # completed sub tree => entries of its films, in the walk order
+        if resume:
+            if os.path.isfile(path):
+                self.load()
+            else:
+                LOGGER.warning("Aucun journal à reprendre : '{}'".format(path))
+        self.resumedSubtrees = len(self.subtrees) > 0
+        self.fh = open(path, "a" if resume else "w", encoding="utf-8")
+        self.count = 0          # films logged (or taken back) during this run
+        self.walked = []        # (sub tree, number of films found when its walk ended), waiting for its films to be logged
+        
+    def load(self):
+        global LOGGER
+        entries = []
+        completed = set()
+        with open(self.filePath, "r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    item = json.loads(line)
+                except ValueError:      # last line cut by the interruption
+                    continue
+                if 'subtree' in item:
+                    completed.add(item['subtree'])
+                else:
+                    entries.append(item)
+                    self.films[item['path']] = item
+        for entry in entries:
+            top = None
+            d = os.path.dirname(entry['path'])
+            while True:
+                if d in completed:
+                    top = d
+                parent = os.path.dirname(d)
+                if parent == d:
+                    break
+                d = parent
+            if top:
+                self.subtrees.setdefault(top, []).append(entry)
+        for subtree in completed - set(self.subtrees):
+            self.subtrees[subtree] = []     # completed sub tree without any film
+        LOGGER.info("Reprise du journal : {} films, {} dossiers terminés".format(len(self.films), len(completed)))
+        
+    def isCompleted(self, dirpath):
+        "the films of the sub tree are all in the journal, it is not walked again"
+        return dirpath in self.subtrees
+        
+    def subtreeFilms(self, dirpath):
+        "entries of the films of a completed sub tree, None if the sub tree must be walked"
+        return self.subtrees.pop(dirpath, None)
+    
+    def entry(self, filepath):
+        return self.films.get(filepath)
+        
+    def add(self, film):
+        if self.films.pop(film.filePath, None) is None and film.filePath not in self.logged:
+            entry = {'path': film.filePath, 'title': film.filmName, 'year': film.filmYear,
+                     'tmdbId': film.tmdbId, 'poster': film.poster, 'note': film.note}
+            self.fh.write(json.dumps(entry) + '\n')
+        self.logged.add(film.filePath)
+        self.count += 1
+        self.logSubtrees()
+        
+    def walkEnded(self, dirpath, filmsCount):
+        "the walk of the sub tree ended after filmsCount films"
+        self.walked.append((dirpath, filmsCount))
+        self.logSubtrees()
+        
+    def logSubtrees(self):
+        while self.walked and self.walked[0][1] <= self.count:
+            self.fh.write(json.dumps({'subtree': self.walked.pop(0)[0]}) + '\n')
+        self.fh.flush()
+        
+    def close(self, completed):
+        self.fh.close()
+        if completed:
+            os.remove(self.filePath)
+
+
+class ReviewQueue:
+    """ Films waiting for a choice of the operator (ambiguous or unknown for TMDB), with the candidates
+        returned by TMDB, stored at the root of the tree (one json line per film).
+        With --defer, the walk puts these films in the queue instead of asking the operator ;
+        the --review pass then asks all the pending choices in one go, without searching TMDB again."""
+    def __init__(self, path):
+        self.filePath = path
+        self.items = collections.OrderedDict()    # film path => candidates
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    try:
+                        item = json.loads(line, object_hook=TMDBObj)
+                    except ValueError:
+                        continue
+                    self.items[item['path']] = item['candidates']
+        self.lock = threading.Lock()
+        
+    def add(self, film):
+        with self.lock:
+            self.items[film.filePath] = film.possibleList
+            with open(self.filePath, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({'path': film.filePath, 'candidates': film.possibleList}) + '\n')
+                
+    def pending(self):
+        "(film path, candidates) of the films waiting for a choice"
+        return list(self.items.items())
+    
+    def done(self, filepath):
+        self.items.pop(filepath, None)
+            
+    def save(self):
+        "rewrites the queue with the films still waiting, removes it when empty"
+        with self.lock:
+            if not self.items:
+                if os.path.isfile(self.filePath):
+                    os.remove(self.filePath)
+                return
+            tmpPath = self.filePath + '.tmp'
+            with open(tmpPath, "w", encoding="utf-8") as fh:
+                for filepath, candidates in self.items.items():
+                    fh.write(json.dumps({'path': filepath, 'candidates': candidates}) + '\n')
+            os.replace(tmpPath, self.filePath)
+
+
+StoredFilm = collections.namedtuple('StoredFilm', 'filePath originalPath filmName filmYear note')
+
+class FilmStore:
+    """ Optional SQLite store of the films found (__TMDB_FILMS.DB at the root of the tree), filled from their sheets :
+        films, people (actors, directors, writers, composers), genres and countries, indexed for queries.
+        The catalog, the notes file and the sheets can be generated again from the store (--export)
+        and the store can be queried (--query)."""
+    ROLES = {'Acteurs': 'actor', 'Metteur en scène': 'director', 'Auteur': 'writer', 'Musique': 'music'}
+    # query field => (roles of people, or column of films, or table of names)
+    QUERY_PEOPLE = {'acteur': 'actor', 'actor': 'actor', 'realisateur': 'director', 'director': 'director',
+                    'auteur': 'writer', 'writer': 'writer', 'musique': 'music', 'music': 'music'}
+    QUERY_COLUMNS = {'titre': 'title', 'title': 'title', 'annee': 'year', 'year': 'year', 'duree': 'runtime', 'runtime': 'runtime'}
+    QUERY_NAMES = {'genre': 'genres', 'pays': 'countries', 'country': 'countries'}
+    
+    def __init__(self, path):
+        self.filePath = path
+        self.lock = threading.Lock()
+        import sqlite3
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS films (path TEXT PRIMARY KEY, position INTEGER, name TEXT, fileYear TEXT,
+                                              tmdbId INTEGER, title TEXT, year INTEGER, runtime INTEGER, poster TEXT, note TEXT);
+            CREATE TABLE IF NOT EXISTS people (id INTEGER PRIMARY KEY, name TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS credits (path TEXT, person INTEGER, role TEXT);
+            CREATE TABLE IF NOT EXISTS genres (path TEXT, name TEXT);
+            CREATE TABLE IF NOT EXISTS countries (path TEXT, name TEXT);
+            CREATE INDEX IF NOT EXISTS films_title ON films (title COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS films_year ON films (year);
+            CREATE INDEX IF NOT EXISTS films_position ON films (position);
+            CREATE INDEX IF NOT EXISTS people_name ON people (name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS credits_person ON credits (person, role);
+            CREATE INDEX IF NOT EXISTS credits_path ON credits (path);
+            CREATE INDEX IF NOT EXISTS genres_name ON genres (name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS genres_path ON genres (path);
+            CREATE INDEX IF NOT EXISTS countries_name ON countries (name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS countries_path ON countries (path);
+            """)
+        self.db.commit()
+        self.nextPosition = self.db.execute("SELECT COALESCE(MAX(position), 0) + 1 FROM films").fetchone()[0]
+        
+    def putFilm(self, film, position=None):
+        "stores the film (position : rank of the film in the walk, None to keep it or add it at the end)"
+        with self.lock:
+            row = self.db.execute("SELECT note, position FROM films WHERE path=?", (film.filePath,)).fetchone()
+            if position is None:
+                position = row[1] if row else self.nextPosition
+            self.nextPosition = max(self.nextPosition, position + 1)
+            if row and row[0] == film.note:
+                self.db.execute("UPDATE films SET position=? WHERE path=?", (position, film.filePath))
+                return
+            self.removePath(film.filePath)
+            if film.originalPath != film.filePath:     # the file was renamed
+                self.removePath(film.originalPath)
+            fields = Film.parseNote(film.note) if film.note else {}
+            year = fields.get('Année', '')
+            runtime = fields.get('Durée (mn)', '')
+            self.db.execute("INSERT INTO films VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (film.filePath, position, film.filmName, film.filmYear, film.tmdbId, fields.get('Titre'),
+                             int(year) if year.isdigit() else None, int(runtime) if runtime.isdigit() else None,
+                             film.poster, film.note))
+            for label, role in FilmStore.ROLES.items():
+                for name in fields.get(label, []):
+                    self.db.execute("INSERT OR IGNORE INTO people (name) VALUES (?)", (name,))
+                    self.db.execute("INSERT INTO credits VALUES (?, (SELECT id FROM people WHERE name=?), ?)", (film.filePath, name, role))
+            self.db.executemany("INSERT INTO genres VALUES (?, ?)", [(film.filePath, g) for g in fields.get('Genre', [])])
+            self.db.executemany("INSERT INTO countries VALUES (?, ?)", [(film.filePath, c) for c in fields.get('Pays', [])])
+            
+    def removePath(self, path):
+        "(lock held)"
+        for table in ('films', 'credits', 'genres', 'countries'):
+            self.db.execute("DELETE FROM {} WHERE path=?".format(table), (path,))
+        
+    def removeFilms(self, paths):
+        with self.lock:
+            for path in paths:
+                self.removePath(path)
+        
+    def removeMissing(self, paths):
+        "after a walk of the whole tree, removes the films which were not found"
+        with self.lock:
+            for (path,) in self.db.execute("SELECT path FROM films").fetchall():
+                if path not in paths:
+                    self.removePath(path)
+                    
+    def films(self, where="1", params=()):
+        "StoredFilm of the films matching the SQL condition, in the walk order"
+        with self.lock:
+            rows = self.db.execute("SELECT path, name, fileYear, note FROM films WHERE {} ORDER BY position".format(where), params).fetchall()
+        return [StoredFilm(path, path, name, fileYear, note) for path, name, fileYear, note in rows]
+    
+    def query(self, text):
+        """ films matching a query made of terms <field><operator><value>, all to be satisfied, e.g.
+            realisateur:Eastwood annee>1990 genre:drame
+            fields : titre, annee, duree, acteur, realisateur, auteur, musique, genre, pays (or their English names)
+            operators : ':' (contains, or equals for numbers), '=', '>', '<', '>=', '<='"""
+        conditions = []
+        params = []
+        import shlex
+        for term in shlex.split(text):
+            m = re.match(r"^(\w+)(>=|<=|:|=|>|<)(.+)$", term)
+            if not m:
+                raise ValueError("Terme de recherche incorrect : '{}'".format(term))
+            field, op, value = TitleMatcher.normalize(m.group(1)).replace(' ', ''), m.group(2), m.group(3)
+            if field in FilmStore.QUERY_COLUMNS:
+                column = FilmStore.QUERY_COLUMNS[field]
+                if column == 'title':
+                    conditions.append("title LIKE ?" if op == ':' else "title = ? COLLATE NOCASE")
+                    params.append('%' + value + '%' if op == ':' else value)
+                else:
+                    conditions.append("{} {} ?".format(column, '=' if op == ':' else op))
+                    params.append(int(value))
+            elif field in FilmStore.QUERY_PEOPLE:
+                conditions.append("path IN (SELECT path FROM credits WHERE role=? AND person IN "
+                                  "(SELECT id FROM people WHERE name {}))".format("LIKE ?" if op == ':' else "= ? COLLATE NOCASE"))
+                params += [FilmStore.QUERY_PEOPLE[field], '%' + value + '%' if op == ':' else value]
+            elif field in FilmStore.QUERY_NAMES:
+                conditions.append("path IN (SELECT path FROM {} WHERE name {})".format(
+                                  FilmStore.QUERY_NAMES[field], "LIKE ?" if op == ':' else "= ? COLLATE NOCASE"))
+                params.append('%' + value + '%' if op == ':' else value)
+            else:
+                raise ValueError("Champ de recherche inconnu : '{}'".format(m.group(1)))
+        return self.films(' AND '.join(conditions) or "1", params)
+        
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
 
 
 class dbFile:
-    "generic catalog file, class to be inherited"
+    """generic catalog file, class to be inherited
+       The records are streamed to a temporary body file as the films are found (open, addFilm),
+       the header is written at close, and the complete file then replaces the previous one.
+       A byte offsets index of the records, keyed by film path, is kept besides the file (<file>.idx),
+       so that films can be replaced or removed without parsing the whole file again.
+       A fragment (--shard) has its records sorted by film path, so that fragments can be merged by streaming."""
     SEPARATOR = '-'*40+'\n'
-    def __init__(self, f):
+    INDEX_SUFFIX = '.idx'
+    BODY_SUFFIX = '.body'
+    def __init__(self, f, sortRecords=False):
         self.filePath = f
-        self.fileTxt = ''
+        self.sortRecords = sortRecords
+        self.body = None      # temporary file receiving the records
+        self.offsets = {}     # film path => [start, length] of its record in bytes
         
     def txtFormat(self, mv): 
         "to be overwritten"
         return mv    
         
+    def recordsIn(self, fh):
+        """ to be overwritten : yields (film path, start, length) of the records of the file opened in binary mode,
+            positioned after the header"""
+        return iter(())
+        
+    @classmethod
+    def encode(cls, txt):
+        "bytes written in the file, with the newlines of the platform"
+        return txt.replace('\n', os.linesep).encode('utf-8')
+    
+    def header(self):
+        global VERSION
+        return ("Fichier édité le {} par TMDB_fetcher.py version {}.\n".format(datetime.datetime.now(), VERSION) +
+                "Copyright C.Mineau - TMDB_fetcher.py est disponible ici : https://github.com/ChristopheMineau/TMDB_fetcher-French.\n" +
+                "La base contient à cette date {} films.\n\n".format(self.nbFilms))
+        
+    def open(self):
+        self.body = open(self.filePath + dbFile.BODY_SUFFIX, "wb")
+        self.bodySize = 0
+        self.offsets = {}
+        self.nbFilms = 0
+        
+    @timedPhase('recordWrite')
     def addFilm(self, mv):
-        self.fileTxt += self.txtFormat(mv)
+        self.addRecord(mv.filePath, dbFile.encode(self.txtFormat(mv)))
+        
+    def addRecord(self, key, data):
+        self.offsets[key] = [self.bodySize, len(data)]
+        self.body.write(data)
+        self.bodySize += len(data)
         self.nbFilms += 1
     
-    def writeFile(self):
+    @timedPhase('fileClose')
+    def close(self):
+        "writes the header followed by the records, then replaces the previous file"
         global LOGGER
-        global VERSION
-        with open(self.filePath, "w", encoding="utf-8") as fh:
-            fh.write("Fichier édité le {} par TMDB_fetcher.py version {}.\n".format(datetime.datetime.now(), VERSION))
-            fh.write("Copyright C.Mineau - TMDB_fetcher.py est disponible ici : https://github.com/ChristopheMineau/TMDB_fetcher-French.\n")
-            fh.write("La base contient à cette date {} films.\n\n".format(self.nbFilms))
-            fh.write(self.fileTxt)
-            LOGGER.debug("Fichier créé : '{}'".format(self.filePath))
+        header = dbFile.encode(self.header())
+        bodyPath = self.body.name
+        self.body.close()
+        self.body = None
+        tmpPath = self.filePath + '.tmp'
+        with open(tmpPath, "wb") as fh, open(bodyPath, "rb") as body:
+            fh.write(header)
+            if self.sortRecords:     # the records are copied again in the order of their paths
+                for key in sorted(self.offsets):
+                    start, length = self.offsets[key]
+                    body.seek(start)
+                    self.offsets[key] = [fh.tell() - len(header), length]
+                    fh.write(body.read(length))
+            else:
+                shutil.copyfileobj(body, fh, 1024*1024)
+        os.replace(tmpPath, self.filePath)
+        os.remove(bodyPath)
+        LOGGER.debug("Fichier créé : '{}'".format(self.filePath))
+        for offset in self.offsets.values():
+            offset[0] += len(header)
+        self.saveIndex()
         print("Consulter le fichier : '{}'".format(self.filePath))
         
-    def readFile(self):
+    def saveIndex(self):
+        st = os.stat(self.filePath)
+        with open(self.filePath + dbFile.INDEX_SUFFIX, "w", encoding="utf-8") as fh:
+            fh.write(json.dumps({"size": st.st_size, "mtime": st.st_mtime_ns, "offsets": self.offsets}))    # dumps : C encoder
+            
+    def loadIndex(self):
+        """ reads the offsets index, or rebuilds it with a single pass on the file when it is missing or out of date
+            returns False if the file does not exist or has not the right format"""
         global LOGGER
         if not os.path.isfile(self.filePath):
             LOGGER.error("Fichier non trouvé : '{}'".format(self.filePath))
             return False
+        st = os.stat(self.filePath)
+        try:
+            with open(self.filePath + dbFile.INDEX_SUFFIX, "r", encoding="utf-8") as fh:
+                index = json.load(fh)
+            if index["size"] == st.st_size and index["mtime"] == st.st_mtime_ns:
+                self.offsets = index["offsets"]
+                self.nbFilms = len(self.offsets)
+                return True
+        except (OSError, ValueError, KeyError):
+            pass
+        LOGGER.debug("Indexation du fichier : '{}'".format(self.filePath))
+        self.offsets = {}
+        with open(self.filePath, "rb") as fh:
+            if not dbFile.skipHeader(fh):
+                LOGGER.error("Erreur: format incorrect pour le fichier : '{}'".format(self.filePath))
+                return False
+            for key, start, length in self.recordsIn(fh):
+                self.offsets[key] = [start, length]
+        self.nbFilms = len(self.offsets)
+        return True
         
-        with open(self.filePath, "r", encoding="utf8") as fh:
-            self.fileTxt = fh.read()
-            LOGGER.debug("Lecture fichier : '{}'".format(self.filePath))
-        #fileListExp = r"^La base contient à cette date (\d+) films.\n\n([\s\S]*)"
-        fileListExp = r"cette date (\d+) films.\n\n([\s\S]*)"
-        m = re.search(fileListExp, self.fileTxt, re.MULTILINE)
-        if m:
-            self.nbFilms = int(m.group(1))
-            self.fileTxt = m.group(2)
+    @classmethod
+    def skipHeader(cls, fh):
+        "positions the file opened in binary mode after its header, returns False if there is no header"
+        for line in fh:
+            if line.startswith("La base contient à cette date".encode('utf-8')):
+                fh.readline()    # empty line after the header
+                return True
+        return False
+        
+    def fragmentRecords(self, path):
+        "yields (film path, record bytes) of a sorted fragment, read sequentially"
+        with open(path, "rb") as fh, open(path, "rb") as reader:
+            if not dbFile.skipHeader(fh):
+                raise ValueError("Erreur: format incorrect pour le fichier : '{}'".format(path))
+            previous = None
+            for key, start, length in self.recordsIn(fh):
+                if previous is not None and key < previous:
+                    raise ValueError("Erreur: le fragment '{}' n'est pas trié ('{}' après '{}')".format(path, key, previous))
+                previous = key
+                reader.seek(start)
+                yield key, reader.read(length)
+                
+    def merge(self, fragments):
+        """ writes the file from sorted fragments, by a k-way merge on the film paths : only one record
+            per fragment is in memory. A film found in several fragments is kept once."""
+        global LOGGER
+        self.open()
+        previous = None
+        for key, data in heapq.merge(*(self.fragmentRecords(path) for path in fragments), key=lambda record: record[0]):
+            if key == previous:
+                LOGGER.warning("Film présent dans plusieurs fragments : '{}'".format(key))
+                continue
+            previous = key
+            self.addRecord(key, data)
+        self.close()
+    
+    @timedPhase('fileUpdate')
+    def updateFilms(self, films, removed=()):
+        """ replaces the records of the films (found by their current or original path), or adds them at the end,
+            and removes the records of the removed paths.
+            The unchanged records are copied by blocks from their known offsets, nothing is parsed.
+            Used while updating the file with a few films, in a single pass."""
+        global LOGGER
+        if not self.loadIndex():
+            return
+        for key in removed:
+            self.offsets.pop(key, None)
+        items = []          # (start offset in the old file, film path, length to copy or new record)
+        added = []
+        for mv in films:
+            record = self.txtFormat(mv)
+            old = sorted(self.offsets.pop(k) for k in {mv.originalPath, mv.filePath} if k in self.offsets)
+            if old:
+                items.append((old[0][0], mv.filePath, record))    # the new record takes the place of the old one
+            else:
+                added.append((mv.filePath, record))
+        items += [(start, key, length) for key, (start, length) in self.offsets.items()]
+        if self.sortRecords:     # the new records are inserted at their place, the kept ones are still copied by blocks
+            items += [(None, key, record) for key, record in added]
+            added = []
+            items.sort(key=lambda item: item[1])
         else:
-            LOGGER.error("Erreur: format incorrect pour le fichier : '{}'".format(self.filePath))
-            return False
-        return True
+            items.sort(key=lambda item: item[0])
+        self.nbFilms = len(items) + len(added)
+        newOffsets = {}
+        tmpPath = self.filePath + '.tmp'
+        with open(self.filePath, "rb") as src, open(tmpPath, "wb") as dst:
+            dst.write(dbFile.encode(self.header()))
+            copyStart = copyEnd = None    # contiguous block of kept records, copied at once
+            
+            def copyBlock():
+                src.seek(copyStart)
+                remaining = copyEnd - copyStart
+                while remaining > 0:
+                    data = src.read(min(1024*1024, remaining))
+                    dst.write(data)
+                    remaining -= len(data)
+                    
+            blockOut = 0
+            for start, key, what in items + [(None, None, None)]:
+                if isinstance(what, int) and start == copyEnd:     # continues the block
+                    newOffsets[key] = [blockOut + start - copyStart, what]
+                    copyEnd += what
+                    continue
+                if copyStart is not None:
+                    copyBlock()
+                    copyStart = copyEnd = None
+                if isinstance(what, int):    # starts a new block
+                    blockOut = dst.tell()
+                    copyStart, copyEnd = start, start + what
+                    newOffsets[key] = [blockOut, what]
+                elif what is not None:       # replaced record
+                    data = dbFile.encode(what)
+                    newOffsets[key] = [dst.tell(), len(data)]
+                    dst.write(data)
+            for key, record in added:
+                data = dbFile.encode(record)
+                newOffsets[key] = [dst.tell(), len(data)]
+                dst.write(data)
+        os.replace(tmpPath, self.filePath)
+        self.offsets = newOffsets
+        self.saveIndex()
+        LOGGER.debug("Fichier mis à jour : '{}'".format(self.filePath))
+        print("Consulter le fichier : '{}'".format(self.filePath))
     
 class Catalog(dbFile):
-    def __init__(self, f):
-        dbFile.__init__(self, f)
+    def __init__(self, f, sortRecords=False):
+        dbFile.__init__(self, f, sortRecords)
         self. nbFilms = 0
         
     def txtFormat(self, mv): 
         "mv is of class Film"
         return "Titre: '{}'    --- Année: '{}'    --- Fiche: {}  --- {}  \n".format(mv.filmName, mv.filmYear, "oui" if mv.note else "non", mv.filePath)
     
-    def removeFilm(self, mv):
-        """ used while updating the catalog : remove if exist the film entry"""
-        lines = self.fileTxt.rstrip().split('\n')     # removes trailing newline before splitting
-        searchExp = "Titre: '{}'    ---".format(mv.filmName)
-        for l in lines:
-            if re.search(searchExp, l):
-                lines.remove(l)
-                break
-        self.fileTxt = '\n'.join(lines)+'\n'
-        self.nbFilms = len(lines)
+    def recordsIn(self, fh):
+        "one line per film, the path is at the end of the line"
+        offset = fh.tell()
+        for line in fh:
+            if line.strip():
+                yield line.rsplit(b'  --- ', 1)[-1].rstrip().decode('utf-8'), offset, len(line)
+            offset += len(line)
         
 class NoteFile(dbFile):
-    def __init__(self, f):
-        dbFile.__init__(self, f)
+    def __init__(self, f, sortRecords=False):
+        dbFile.__init__(self, f, sortRecords)
         self. nbFilms = 0
     
     def txtFormat(self, mv):
@@ -169,53 +1190,275 @@ class NoteFile(dbFile):
             note = "Chemin : {}\nAucune info sur TMDB.".format(mv.filePath)
         return "{sep}{}\n{sep}\n\n".format(note, sep=dbFile.SEPARATOR)
         
-    def removeFilm(self, mv):
-        """ used while updating the Notes file : remove if exist the film entry"""
-        lines = self.fileTxt.split('\n')     # removes trailing newline before splitting
-        searchExp =  re.escape("Chemin : {}".format(mv.filePath))   
-        sepExp = '^' + dbFile.SEPARATOR[:10]
-        # look for the movie record line beginning and line end
-        prevSepIdx = None
-        nextSepIdx = None
-        recordFound = False
-        for idx, l in enumerate(lines):
-            if re.search(sepExp, l):
-                if recordFound:          # we are inside the searched record
-                    nextSepIdx = idx + 2 # include the 2 newlines after line separator
-                    break
-                else:
-                    prevSepIdx = idx     # this a beginning of a record
+    def recordsIn(self, fh):
+        """ a record goes from a separator line to the next one, with the empty lines which follow.
+            The path is given by the 'Chemin : ' line"""
+        sep = dbFile.SEPARATOR.strip().encode('utf-8')
+        chemin = "Chemin : ".encode('utf-8')
+        offset = fh.tell()
+        start = key = None
+        closed = False
+        for line in fh:
+            stripped = line.rstrip()
+            if closed:
+                if not stripped:
+                    offset += len(line)
                     continue
-            if re.search(searchExp, l):  # found the record
-                recordFound = True
-        # delete the record if found
-        if recordFound and prevSepIdx and nextSepIdx:
-            del lines[prevSepIdx : nextSepIdx+1]
-            self.nbFilms -= 1
-        # rejoin the lines         
-        self.fileTxt = '\n'.join(lines)
+                if key is not None:
+                    yield key, start, offset - start
+                start = key = None
+                closed = False
+            if start is None:
+                if stripped == sep:
+                    start = offset
+            elif stripped == sep:
+                closed = True
+            elif key is None and line.startswith(chemin):
+                key = stripped[len(chemin):].decode('utf-8')
+            offset += len(line)
+        if closed and key is not None:
+            yield key, start, offset - start
+        
+class Coalescer:
+    """ In-run memo of lookups, keyed by a normalized key : the first lookup of a key is made,
+        the concurrent or later lookups of the same key wait for it and share its result.
+        A failed lookup is not kept, the next one will try again.
+        Only the size most recently used results are kept (the copies of a film are found close
+        in the walk), the lookups in progress are always kept."""
+    def __init__(self, name, size=SHARED_RESULTS):
+        self.name = name
+        self.size = size
+        self.lock = threading.Lock()
+        self.results = collections.OrderedDict()     # key => Future, the most recently used last
+        self.hits = 0
+        self.misses = 0
         
+    def get(self, key, lookup):
+        "returns (result, shared) ; shared is True when the result comes from another lookup"
+        with self.lock:
+            future = self.results.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.results[key] = future
+                self.misses += 1
+                if len(self.results) > self.size:
+                    self.evict()
+            else:
+                self.results.move_to_end(key)
+                self.hits += 1
+        if owner:
+            try:
+                future.set_result(lookup())
+            except Exception as e:
+                with self.lock:
+                    del self.results[key]
+                future.set_exception(e)
+        return future.result(), not owner
+    
+    def evict(self):
+        "drops the least recently used results beyond size, lock held"
+        done = [key for key, future in self.results.items() if future.done()]
+        for key in done[:len(self.results) - self.size]:
+            del self.results[key]
+    
+    def summary(self):
+        total = self.hits + self.misses
+        return "{} partagées : {} / {} ({:.0%})".format(self.name, self.hits, total, self.hits / total if total else 0)
+
+SEARCHES = Coalescer("Recherches TMDB")     # shared by the films with the same normalized title and year
+DETAILS = Coalescer("Fiches TMDB")          # shared by the films with the same TMDB id
+
+
+class TitleMatcher:
+    """ Scores how well a TMDB result matches a film name and year parsed from a file name.
+        Titles are compared once normalized : accents removed, lower case, punctuation, articles
+        and release noise (1080p, x264, DVDRip...) removed. Both title and original_title are tried.
+        A year within YEAR_TOLERANCE costs a little, a further year excludes the result.
+        A part of a film (CD1, part2) is never selected : its parts would get the same name.
+        Titles whose numbers differ (sequels : Toy Story 2 and 3, Rocky II) do not match at all."""
+    STOP_WORDS = {'le', 'la', 'les', 'l', 'un', 'une', 'des', 'du', 'de', 'd', 'et',
+                  'the', 'a', 'an', 'of', 'and'}
+    NOISE = re.compile(r"^(\d{3,4}p|[xh]26[45]|hevc|bluray|brrip|bdrip|dvdrip|dvdscr|webrip|webdl|hdtv|hdrip|xvid|divx|"
+                       r"aac|ac3|dts|multi|vostfr|vost|vf|vff|vfq|truefrench|subfrench|proper|repack|extended|unrated|"
+                       r"remastered|cd\d|part\d|4k|uhd|hdr|10bit)$")
+    PART = re.compile(r"^(cd|part)\d$")
+    ROMAN = {'ii': 2, 'iii': 3, 'iv': 4, 'v': 5, 'vi': 6, 'vii': 7, 'viii': 8, 'ix': 9, 'x': 10}     # not 'i', a word in English
+    YEAR_PENALTY = 0.05
+    
+    @classmethod
+    def normalize(cls, title):
+        if not title:
+            return ''
+        t = unicodedata.normalize('NFKD', title)
+        t = ''.join(c for c in t if not unicodedata.combining(c)).lower()
+        t = t.replace('web-dl', 'webdl')
+        words = re.sub(r"[^\w]+", ' ', t).split()
+        kept = [w for w in words if w not in cls.STOP_WORDS and not cls.NOISE.match(w)]
+        return ' '.join(kept) if kept else ' '.join(words)
+    
+    @classmethod
+    def isPart(cls, title):
+        "the title carries a part marker, removed by normalize"
+        return any(cls.PART.match(w) for w in re.sub(r"[^\w]+", ' ', title.lower()).split())
+    
+    @classmethod
+    def similarity(cls, a, b):
+        "a and b normalized"
+        if not a or not b:
+            return 0.0
+        if a == b:
+            return 1.0
+        import difflib
+        return difflib.SequenceMatcher(None, a, b).ratio()
+    
+    @classmethod
+    def numbers(cls, title):
+        "numbers of a normalized title, the roman numerals included"
+        return {int(w) if w.isdigit() else cls.ROMAN[w] for w in title.split() if w.isdigit() or w in cls.ROMAN}
+    
+    @classmethod
+    def titleSimilarity(cls, name, title):
+        "name normalized, title as given by TMDB : 0 when their numbers differ (another film of a series)"
+        title = cls.normalize(title)
+        if cls.numbers(name) != cls.numbers(title):
+            return 0.0
+        return cls.similarity(cls.arabic(name), cls.arabic(title))
+    
+    @classmethod
+    def arabic(cls, title):
+        "normalized title with its roman numerals as digits : Rocky II matches Rocky 2"
+        return ' '.join(str(cls.ROMAN[w]) if w in cls.ROMAN else w for w in title.split())
+    
+    @classmethod
+    def score(cls, name, year, candidate):
+        "name normalized, year a string or None, candidate a TMDB search result"
+        s = max(cls.titleSimilarity(name, candidate.title),
+                cls.titleSimilarity(name, candidate.get('original_title')))
+        candidateYear = Film.getYearFromTmdbDate(candidate.release_date)
+        if year and candidateYear.isdigit():
+            gap = abs(int(year) - int(candidateYear))
+            if gap > YEAR_TOLERANCE:
+                return 0.0
+            s -= gap * cls.YEAR_PENALTY
+        elif year:
+            s -= cls.YEAR_PENALTY     # unknown release date
+        return s
+    
+    @classmethod
+    def best(cls, filmName, year, candidates):
+        """ returns (candidate, score) if a single candidate reaches MATCH_THRESHOLD, else (None, best score)"""
+        name = cls.normalize(filmName)
+        scored = sorted(((cls.score(name, year, c), i) for i, c in enumerate(candidates)), reverse=True)
+        if not scored:
+            return None, 0.0
+        bestScore, bestIdx = scored[0]
+        if bestScore < MATCH_THRESHOLD or cls.isPart(filmName):
+            return None, bestScore
+        if len(scored) > 1 and scored[1][0] >= MATCH_THRESHOLD:
+            if scored[1][0] >= bestScore or year is None:
+                return None, bestScore      # several films compete (remakes...) : the operator chooses
+        return candidates[bestIdx], bestScore
+
+
 class Film:
-    def __init__(self, f, dontKeepIfExist):
+    def __init__(self, f, dontKeepIfExist, resolve=True, indexEntry=None):
+        """ resolve=False only prepares the film : the caller then runs lookup(), askOperator() and fetchDetails()
+            itself (used by the concurrent mode of MovieDB)
+            indexEntry : the film is already known by the ScanIndex, nothing to read or to search"""
         global DEBUG
         global LOGGER
         self.filePath = f 
+        self.originalPath = f     # before renaming
         self.fileDir = os.path.dirname(f)
-        self.filmName , self.filmYear, self.filmExtension = Film.getFilmNameAndYearFromPath(f)
-        sheetPath = Film.doesSheetAlreadyExist(f, dontKeepIfExist)
-        if sheetPath: 
-            self.initFromExistingSheet(sheetPath)
+        self.tmdbId = None
+        self.possibleList = []
+        self.apiCalls = 0
+        self.searchFailed = False
+        self.translations = {}     # other language => (title, note)
+        self.oldSheet = None     # sheet to replace, kept until the new note is written
+        if indexEntry:
+            self.initFromIndex(indexEntry)
         else:
-            self.poster = None  
-            TMDBSearchEnd = False
+            self.filmName , self.filmYear, self.filmExtension = Film.getFilmNameAndYearFromPath(f)
+            sheetPath = Film.doesSheetAlreadyExist(f)
+            if sheetPath and not dontKeepIfExist: 
+                self.toResolve = False
+                self.initFromExistingSheet(sheetPath)
+            else:
+                self.toResolve = True
+                self.oldSheet = sheetPath
+                self.poster = None  
+                self.note = None
+        if resolve and (self.toResolve or len(LANGUAGES) > 1):
+            self.lookup()
+            self.askOperator()
+            self.fetchDetails()
+                
+    @timedPhase('lookup')
+    def lookup(self):
+        """ first TMDB search, no interaction with the operator : may run in a worker thread"""
+        global LOGGER
+        self.searchFailed = False
+        if self.toResolve:
+            callsBefore = MOVIE.callCount()
+            try:
+                self.queryTMDB()
+            except TMDBError as e:
+                LOGGER.warning("Recherche impossible pour le film '{}' : {}".format(self.filmName, e))
+                self.searchFailed = True
+            self.apiCalls += MOVIE.callCount() - callsBefore
+    
+    @timedPhase('operator')
+    def askOperator(self):
+        """ if the search was not conclusive, asks the operator until an answer is found : main thread only"""
+        global LOGGER
+        if not self.toResolve or self.searchFailed:
+            return
+        if DEFER and not self.tmdbId:
+            LOGGER.info("Choix reporté pour le film '{}' ({} possibilités)".format(self.filePath, len(self.possibleList)))
+            REVIEW.add(self)
+            return
+        callsBefore = MOVIE.callCount()
+        with CONSOLE_LOCK:
+            TMDBSearchEnd = True if self.tmdbId else self.proposeAlternative()
             while not TMDBSearchEnd:
                 self.queryTMDB()
                 TMDBSearchEnd = True if self.tmdbId else self.proposeAlternative()
-            self.buildNote()
-            self.writeNote()
-            if self.poster:
-                self.downloadPoster()
+        self.apiCalls += MOVIE.callCount() - callsBefore
+    
+    @timedPhase('fetchDetails')
+    def fetchDetails(self):
+        """ builds and writes the note and gets the poster : may run in a worker thread"""
+        global LOGGER
+        self.possibleList = []     # the film is chosen, the TMDB candidates are no longer needed
+        if self.toResolve:
+            callsBefore = MOVIE.callCount()
+            try:
+                self.buildNote()
+            except TMDBError as e:
+                LOGGER.warning("Fiche impossible pour le film '{}' : {}".format(self.filmName, e))
+                self.note = None
+            self.apiCalls += MOVIE.callCount() - callsBefore
+            LOGGER.info("Appels API TMDB pour le film '{}' : {}".format(self.filmName, self.apiCalls))
+            if self.note or not self.oldSheet:
+                self.writeNote()
+                if self.poster and POSTERS:
+                    self.downloadPoster()
+            else:
+                self.keepOldSheet()
+        elif len(LANGUAGES) > 1:     # known film : the sheets of the other languages are read, or built if missing
+            self.collectTranslations(self.requestTranslations(withCredits=True))
                 
+    def initFromIndex(self, indexEntry):
+        self.toResolve = False
+        self.filmName = indexEntry['title']
+        self.filmYear = indexEntry['year']
+        self.filmExtension = os.path.splitext(self.filePath)[1]
+        self.tmdbId = indexEntry['tmdbId']
+        self.poster = indexEntry['poster']
+        self.note = indexEntry['note']
+        
     def initFromExistingSheet(self, sheetPath):
         with open(sheetPath, "r", encoding="utf-8") as f:
             self.note = f.read()
@@ -233,29 +1476,45 @@ class Film:
             return False
         if DO_NOT_INDEX in p:    # filters explicitely what must not be indexed
             return False
+        return Film.isMovieName(f)
+    
+    @classmethod
+    def isMovieName(cls, f):
+        "movie file, its directory being already known as walked"
+        global DO_NOT_INDEX
         if DO_NOT_INDEX in f:    # filters explicitely what must not be indexed
             return False
         filename, file_extension = os.path.splitext(f)
-        return file_extension.lower() in {'.avi', '.mp4', '.mpg', '.mpeg', '.mkv'}
+        return file_extension.lower() in MOVIE_EXTENSIONS
+    
+    @classmethod
+    def isExcludedDir(cls, name):
+        "directories not walked, nor their sub directories : trash of Windows, _NOTMDB"
+        global DO_NOT_INDEX
+        return "RECYCLE.BIN" in name or DO_NOT_INDEX in name
     
     @classmethod
-    def doesSheetAlreadyExist(cls, f, dontKeepIfExist):
-        """ checks if the sheet and poster already exist (update case)"""
+    def isUnchanged(cls, f, indexEntry):
+        "the file and its sheet are still as recorded in the ScanIndex"
+        global SHEET_SUFFIX
+        try:
+            st = os.stat(f)
+        except OSError:
+            return False
+        return st.st_size == indexEntry['size'] and st.st_mtime_ns == indexEntry['mtime'] \
+               and os.path.isfile(os.path.splitext(f)[0] + SHEET_SUFFIX)
+    
+    @classmethod
+    def doesSheetAlreadyExist(cls, f):
+        """ returns the path of the sheet if it already exists (update case), else None.
+            A sheet to replace is only overwritten once the new note is built (see writeNote)"""
         global SHEET_SUFFIX
-        global POSTER_SUFFIX
         global LOGGER
         filePathAndName, fileExtension = os.path.splitext(f)
         sheetPath =  filePathAndName + SHEET_SUFFIX 
         
         if os.path.isfile(sheetPath):
             LOGGER.info("La fiche existe déjà pour le film  : '{}'".format(f))
-            if dontKeepIfExist:
-                try:
-                    os.remove(sheetPath)
-                    LOGGER.info("Fichier supprimé : '{}'".format(sheetPath))
-                except:
-                    LOGGER.warn("Impossible de supprimer : '{}'".format(sheetPath))
-                sheetPath = None
         else:
             sheetPath = None
         
@@ -263,8 +1522,16 @@ class Film:
 
     
     @classmethod    
+    @timedPhase('parseName')
     def getFilmNameAndYearFromPath(cls, p):
         global LOGGER
+        filmName, year, fileExtension = Film.splitFilmName(p)
+        LOGGER.info("\n\n"+'-'*80+"\n{} ==> Titre='{}' année='{}'".format(p, filmName , year)) 
+        return filmName, year, fileExtension
+        
+    @classmethod
+    def splitFilmName(cls, p):
+        "(title, year, extension) given by the file name"
         baseName = os.path.basename(p)
         fileName, fileExtension = os.path.splitext(baseName)
         yearExp = "[\s\.-]*\(?(\d\d\d\d)\)?\s*$"
@@ -277,7 +1544,6 @@ class Film:
             filmName = fileName
         filmName = filmName.replace('.',' ')
         filmName = filmName.replace('_',' ')
-        LOGGER.info("\n\n"+'-'*80+"\n{} ==> Titre='{}' année='{}'".format(p, filmName , year)) 
         return filmName, year, fileExtension 
     
     @classmethod    
@@ -286,46 +1552,84 @@ class Film:
     
     def queryTMDB(self):
         """Queries TMDB and tries to narrow the list returned by date
-        sets tmdbId if found else possibleList"""
+        sets tmdbId if found else possibleList.
+        When the year is known, it is given to TMDB and the pages stop as soon as a single film
+        matches title and year (TitleMatcher); the search without year is only made if the year selects no film."""
         global LOGGER
         self.tmdbId = None
         self.possibleList = []
-        print("Recherche d'informations sur le film '{}'.".format(self.filmName))
-        pg = 1
-        filmList = []
-        searchEnd = False
-        while not searchEnd and pg<=4: 
-            pageList =  MOVIE.search(self.filmName, page=pg)
-            filmList += pageList
-            if len(pageList) != 20:
-                searchEnd = True
-            else:
-                pg += 1
+        LOGGER.info("Recherche d'informations sur le film '{}'.".format(self.filmName))
+        (filmList, pagesCount, selectedFilm), shared = SEARCHES.get(Film.searchKey(self.filmName, self.filmYear), self.searchTMDB)
+        if shared:
+            LOGGER.info("Recherche partagée avec un film de même titre et même année.")
+        else:
+            LOGGER.info("Pages TMDB consultées pour le film '{}' : {}".format(self.filmName, pagesCount))
         LOGGER.info("TMDB a retourné {} possibilités : {}".format(len(filmList), [f.title+'-'+f.release_date for f in filmList]))
-        # check if in the list something matches with the file Year
-        if self.filmYear:
-            foundCount = 0
-            for f in filmList:
-                if Film.getYearFromTmdbDate(f.release_date)==self.filmYear and self.filmName.strip().lower()==f.title.strip().lower():
-                    foundCount += 1
-                    selectedFilm = f
-            if foundCount == 1:  # If only one film with matching year, consider it is it
-                LOGGER.info("Le titre et l'année correspondent.")
-                self.tmdbId = selectedFilm.id
-                self.renameFilm("{} - {}".format(selectedFilm.title, Film.getYearFromTmdbDate(selectedFilm.release_date)))
-                return  
+        if selectedFilm:  # If only one film matches title and year, consider it is it
+            LOGGER.info("Le titre et l'année correspondent.")
+            self.tmdbId = selectedFilm.id
+            if self.hasTwinInDir():
+                LOGGER.info("Un autre film du répertoire partage cette recherche, le nom est gardé : {}".format(self.filePath))
             else:
-                self.tmdbId = None
-        else:
-            if len(filmList)==1:
-                selectedFilm = filmList[0]
-                self.tmdbId = selectedFilm.id
                 self.renameFilm("{} - {}".format(selectedFilm.title, Film.getYearFromTmdbDate(selectedFilm.release_date)))
-                return
-            else:
-                self.tmdbId = None
+            return  
         self.possibleList = filmList  # otherwise returns the list, possibly empty list
-             
+        
+    def hasTwinInDir(self):
+        "another film of the directory, with the same extension, shares the search : both would get the same name"
+        key = Film.searchKey(self.filmName, self.filmYear)
+        try:
+            names = os.listdir(self.fileDir)
+        except OSError:
+            return False
+        for name in names:
+            if name != os.path.basename(self.filePath) and Film.isMovieName(name):
+                filmName, year, fileExtension = Film.splitFilmName(name)
+                if fileExtension.lower() == self.filmExtension.lower() and Film.searchKey(filmName, year) == key:
+                    return True
+        return False
+        
+    @classmethod
+    def searchKey(cls, filmName, year):
+        """ key of the searches shared by SEARCHES : the parts of a film (never selected, see TitleMatcher) only share
+            their search with other parts, the part marker being removed by normalize"""
+        return TitleMatcher.normalize(filmName), year, TitleMatcher.isPart(filmName)
+        
+    def searchTMDB(self):
+        "returns (films, pages fetched, film selected or None)"
+        global LOGGER
+        if self.filmYear:
+            filmList, pagesCount, selectedFilm = self.searchPages(year=self.filmYear)
+            if not selectedFilm:     # the release year may differ by YEAR_TOLERANCE from the year of TMDB
+                LOGGER.info("Aucun film retenu pour l'année {}, recherche sans l'année.".format(self.filmYear))
+                yearList = filmList
+                filmList, pages, selectedFilm = self.searchPages()
+                pagesCount += pages
+                ids = {f.id for f in yearList}
+                filmList = yearList + [f for f in filmList if f.id not in ids]     # the films of the year first
+        else:
+            filmList, pagesCount, selectedFilm = self.searchPages()
+            if not selectedFilm and len(filmList)==1 and not TitleMatcher.isPart(self.filmName):
+                selectedFilm = filmList[0]
+        return filmList, pagesCount, selectedFilm
+        
+    def searchPages(self, year=None):
+        """ fetches up to 4 pages of TMDB results.
+            returns (films, pages fetched, film selected by the TitleMatcher or None)
+            the pages stop as soon as a film is selected"""
+        global LOGGER
+        filmList = []
+        for pg in range(1, 5): 
+            pageList = MOVIE.search(self.filmName, page=pg, year=year)
+            filmList += pageList
+            selectedFilm, score = TitleMatcher.best(self.filmName, self.filmYear, filmList)
+            if len(pageList) != 20 or selectedFilm:
+                break
+        if selectedFilm:
+            LOGGER.info("Correspondance retenue : '{}' - {} (score {:.2f})".format(selectedFilm.title, selectedFilm.release_date, score))
+        elif filmList:
+            LOGGER.info("Pas de correspondance sûre (meilleur score {:.2f})".format(score))
+        return filmList, pg, selectedFilm
 
     def proposeAlternative(self):
         """ In case 0 or several films compete, ask the operator for his choice"""
@@ -428,12 +1732,15 @@ class Film:
         global LOGGER
         
         def askUser():
+            if DEFER:     # nobody answers during the walk
+                return False
             correctAnswer = False
-            print("Erreur de renommage du fichier {}\nS'il est en cours de lecture, veuillez le fermer.\nPeut-être qu'un fichier existe déjà du même nom.".format(self.filePath))
-            while not correctAnswer:
-                print("Ré-essayer ? (O/N) : ", end='')
-                r = input().lower()
-                correctAnswer = r in {'o', 'n'}
+            with CONSOLE_LOCK:   # the renaming may happen in a worker thread
+                print("Erreur de renommage du fichier {}\nS'il est en cours de lecture, veuillez le fermer.\nPeut-être qu'un fichier existe déjà du même nom.".format(self.filePath))
+                while not correctAnswer:
+                    print("Ré-essayer ? (O/N) : ", end='')
+                    r = input().lower()
+                    correctAnswer = r in {'o', 'n'}
             return r == 'o'
                   
         # sanitization
@@ -448,6 +1755,9 @@ class Film:
         r = r.replace('*', ' ')
         newFilePath = os.path.join(self.fileDir, r + self.filmExtension)
         if newFilePath != self.filePath:
+            if os.path.exists(newFilePath) and not Film.isSameFile(self.filePath, newFilePath):
+                LOGGER.warning("Renommage de '{}' refusé, '{}' existe déjà : le nom est gardé.".format(self.filePath, newFilePath))
+                return False
             LOGGER.info("Renommage '{}' => '{}'".format(self.filePath, newFilePath))
             tryRenaming = True
             while tryRenaming:
@@ -463,35 +1773,125 @@ class Film:
             self.filmName , self.filmYear, self.filmExtension = Film.getFilmNameAndYearFromPath(newFilePath) 
         return True    
             
+    @classmethod
+    def isSameFile(cls, a, b):
+        "a renaming which only changes the case, on a file system ignoring it"
+        try:
+            return os.path.samefile(a, b)
+        except OSError:
+            return False
+            
     def buildNote(self):
         global LOGGER
        
         if self.tmdbId:
-            details = MOVIE.details(self.tmdbId)
-            credits = MOVIE.credits(self.tmdbId)
-            actorsList =  [a['name'] for a in credits.cast]
-            genreList = [g['name'] for g in details.genres]
-            directorList = [d['name'] for d in credits.crew if d['job']=="Director"]
-            writersList = [d['name'] for d in credits.crew if d['job']=="Screenplay"]
-            music = [d['name'] for d in credits.crew if "Music" in d['job']]
-            pays = [p['name'] for p in details.production_countries]
-            self.poster = "http://image.tmdb.org/t/p/w400" + details.poster_path if details.poster_path else None
-            self.note = "Titre : {}\n".format (details.title)
-            self.note += "Chemin : {}\n".format (self.filePath)    
-            self.note += "Année : {}\n".format (Film.getYearFromTmdbDate(details.release_date))
-            self.note += "Acteurs : {}\n".format (actorsList)
-            self.note += "Genre : {}\n".format (genreList)
-            self.note += "Pays : {}\n".format (pays)
-            self.note += "Affiche : {}\n".format (self.poster)
-            self.note += "Durée (mn) : {}\n".format (details.runtime)
-            self.note += "Metteur en scène : {}\n".format (directorList)
-            self.note += "Auteur : {}\n".format (writersList) 
-            self.note += "Musique : {}\n".format (music) 
-            self.note += "Synopsis : {}".format (textwrap.fill(details.overview,80))
+            # details and credits in a single request, shared by the copies of the same film
+            translations = self.requestTranslations()     # sent while the details of the first language are fetched
+            details, shared = DETAILS.get(self.tmdbId, lambda: MOVIE.details(self.tmdbId, append='credits'))
+            self.poster = TMDB_IMAGE_URL + details.poster_path if details.poster_path else None
+            self.note = Film.noteFromDetails(details, details.credits, self.filePath, self.poster)
+            self.collectTranslations(translations, details.credits)
         else:
             self.note = None
         LOGGER.info(self.note)
         
+    @classmethod
+    def noteFromDetails(cls, details, credits, filePath, poster):
+        "text of the sheet from the TMDB details of the film (see MovieApi.details), in their language"
+        return Film.formatNote({'Titre': details.title,
+                                'Chemin': filePath,
+                                'Année': Film.getYearFromTmdbDate(details.release_date or ''),
+                                'Acteurs': credits.cast,
+                                'Genre': details.genres,
+                                'Pays': details.production_countries,
+                                'Affiche': poster,
+                                'Durée (mn)': details.runtime,
+                                'Metteur en scène': credits.directors,
+                                'Auteur': credits.writers,
+                                'Musique': credits.music,
+                                'Synopsis': textwrap.fill(details.overview or '',80)})
+        
+    def translationSheet(self, language):
+        global SHEET_SUFFIX
+        return os.path.splitext(self.filePath)[0] + languageName(SHEET_SUFFIX, language)
+        
+    def requestTranslations(self, withCredits=False):
+        """ sends at once to TRANSLATIONS the requests of the details in the other languages (LANGUAGES[1:]) :
+            one request per language, the credits and the poster of the first language are reused.
+            For a known film, the sheets which exist are read instead. Returns the [(language, future)]"""
+        global LANGUAGES
+        global TRANSLATIONS
+        futures = []
+        append = 'credits' if withCredits else None
+        for language in LANGUAGES[1:]:
+            sheetPath = self.translationSheet(language)
+            if not self.toResolve and os.path.isfile(sheetPath):
+                with open(sheetPath, "r", encoding="utf-8") as fh:
+                    note = fh.read()
+                self.translations[language] = (Film.parseNote(note).get('Titre', self.filmName), note)
+            elif self.tmdbId:
+                futures.append((language, TRANSLATIONS.submit(DETAILS.get, (self.tmdbId, language, append),
+                                                              lambda language=language: MOVIE.details(self.tmdbId, append, language))))
+        return futures
+        
+    def collectTranslations(self, futures, credits=None):
+        "builds and writes the sheets of the other languages from the answers of requestTranslations()"
+        global LOGGER
+        for language, future in futures:
+            try:
+                details, shared = future.result()
+            except TMDBError as e:
+                LOGGER.warning("Fiche '{}' impossible pour le film '{}' : {}".format(language, self.filmName, e))
+                continue
+            note = Film.noteFromDetails(details, credits or details.credits, self.filePath, self.poster)
+            self.translations[language] = (details.title, note)
+            LOGGER.info("Ecriture fiche  : {}".format(self.translationSheet(language)))
+            with open(self.translationSheet(language), "w", encoding="utf-8") as fh:
+                fh.write(note)
+                
+    def translated(self, language):
+        "StoredFilm of the film in another language, for its catalog and notes file"
+        title, note = self.translations.get(language, (self.filmName, None))
+        return StoredFilm(self.filePath, self.originalPath, title, self.filmYear, note)
+        
+    @classmethod
+    def formatNote(cls, fields):
+        "text of the sheet, fields : NOTE_FIELDS => value"
+        global NOTE_FIELDS
+        return '\n'.join("{} : {}".format(label, fields[label]) for label in NOTE_FIELDS)
+    
+    @classmethod
+    def parseNote(cls, note):
+        "fields of a sheet text, the lists are read back as lists"
+        global NOTE_FIELDS
+        global NOTE_LISTS
+        import ast
+        fields = {}
+        lines = note.split('\n')
+        for idx, line in enumerate(lines):
+            label, sep, value = line.partition(' : ')
+            if label == 'Synopsis':     # last field, on several lines
+                fields[label] = '\n'.join([value] + lines[idx+1:])
+                break
+            if label in NOTE_LISTS:
+                try:
+                    value = ast.literal_eval(value)
+                except (ValueError, SyntaxError):
+                    value = []
+            if label in NOTE_FIELDS:
+                fields[label] = value
+        return fields
+        
+    @classmethod
+    def relocatedNote(cls, note, filePath):
+        """ the note with its 'Chemin' set to the current path of the film (library moved), None if it is already right
+            or if the film of the 'Chemin' still exists (films of the same name with another extension share their sheet)"""
+        m = re.search(r"^Chemin : (.*)$", note, re.MULTILINE)
+        if m is None or m.group(1) == filePath or os.path.exists(m.group(1)):
+            return None
+        return note[:m.start()] + "Chemin : " + filePath + note[m.end():]
+        
+    @timedPhase('writeNote')
     def writeNote(self):
         global LOGGER
         global SHEET_SUFFIX
@@ -503,34 +1903,130 @@ class Film:
             LOGGER.info("Ecriture fiche  : {}".format(noteFileName))  
             with open(noteFileName, "w", encoding="utf-8") as f:
                     f.write(self.note)
+            oldSheet = getattr(self, 'oldSheet', None)     # a StoredFilm (--export) has none
+            if oldSheet:
+                if oldSheet != noteFileName:     # the film was renamed : the sheet follows it
+                    self.removeOldSheet()
+                self.oldSheet = None
         else:
             LOGGER.info("Aucune info pour le film : {}".format(self.filmName))  
        
+    def removeOldSheet(self):
+        global LOGGER
+        if self.oldSheet:
+            try:
+                os.remove(self.oldSheet)
+                LOGGER.info("Fichier supprimé : '{}'".format(self.oldSheet))
+            except OSError:
+                LOGGER.warning("Impossible de supprimer : '{}'".format(self.oldSheet))
+        
+    def keepOldSheet(self):
+        """ no new note (TMDB unreachable, film not in the cache, choice skipped or deferred) :
+            the film keeps its previous sheet, unless the operator chose to ignore it"""
+        global LOGGER
+        global DO_NOT_INDEX
+        if DO_NOT_INDEX in os.path.basename(self.filePath):
+            self.removeOldSheet()
+            return
+        LOGGER.info("Fiche précédente conservée pour le film : {}".format(self.filePath))
+        self.initFromExistingSheet(self.oldSheet)
+        note = Film.relocatedNote(self.note, self.filePath)
+        if note:     # renamed meanwhile
+            self.note = note
+            self.writeNote()
+        
     def downloadPoster(self):
+        "the poster is downloaded in the background by POSTERS"
         global POSTER_SUFFIX
-        global LOGGER
         dirName =  os.path.dirname(self.filePath)
         baseName = os.path.basename(self.filePath)
         fileName, fileExt = os.path.splitext(baseName)
         posterName, posterExt = os.path.splitext(self.poster)
         posterPath = os.path.join(dirName, fileName + POSTER_SUFFIX + posterExt)
-        if os.path.isfile(posterPath):
-            LOGGER.info("Affiche existe déjà : {}".format(posterPath))
-            try:
-                os.remove(posterPath)
-                LOGGER.info("Affiche supprimée : {}".format(posterPath))
-            except:
-                LOGGER.warn("Impossible de supprimer : {}".format(posterPath))
-        try:
-            downloadName = wget.download(self.poster, out=posterPath)
-            LOGGER.info("Affiche téléchargée : {}".format(posterPath))
-            print("\n\n")
-        except:
-            LOGGER.warn("Echec de téléchargement: {}".format(self.poster)) 
-            return
+        POSTERS.submit(self.poster, posterPath)
                 
 
     
+class FilmRecord:
+    """ Catalog level fields of a film already written to the catalog and the notes file :
+        its note and TMDB candidates are released, the walk keeps one small record per film."""
+    __slots__ = ('filePath', 'originalPath', 'filmName', 'filmYear', 'tmdbId', 'hasNote')
+    
+    def __init__(self, film):
+        self.filePath = film.filePath
+        self.originalPath = film.originalPath
+        self.filmName = film.filmName
+        self.filmYear = film.filmYear
+        self.tmdbId = film.tmdbId
+        self.hasNote = bool(film.note)
+        
+
+class DirScanner:
+    """ Lists the directories of the tree in a pool of threads, ahead of the walk which consumes them in its own order.
+        The excluded directories (Film.isExcludedDir) are pruned before being listed, and the listing only uses
+        the scandir entries (no stat per file). When a directory is listed, its sub directories are listed in turn
+        while the walk is still handling the films, up to maxAhead listings waiting for the walk.
+        keep(name) : files kept in the listings ; a directory unchanged in the ScanIndex is not listed again."""
+    def __init__(self, workers, keep, index=None, skip=None):
+        self.keep = keep
+        self.index = index
+        self.skip = skip      # skip(dirpath) : sub tree not walked (completed in the journal)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.pending = {}     # directory => Future of its listing, not yet taken by the walk
+        self.maxAhead = workers * 64
+        
+    def prefetch(self, dirpath):
+        with self.lock:
+            if dirpath not in self.pending and not (self.skip and self.skip(dirpath)):
+                self.pending[dirpath] = self.pool.submit(self.listDir, dirpath)
+                
+    def prefetchSubdirs(self, dirpath, subdirs):
+        for subdir in subdirs:
+            self.prefetch(os.path.join(dirpath, subdir))
+        
+    def get(self, dirpath):
+        """ returns (known, sub directories, files) of the directory, sorted, known : taken from the ScanIndex,
+            or None if the directory is not accessible"""
+        self.prefetch(dirpath)
+        with self.lock:
+            future = self.pending.pop(dirpath)
+        listing = future.result()
+        if listing:
+            self.prefetchSubdirs(dirpath, listing[1])
+        return listing
+        
+    def listDir(self, dirpath):
+        global LOGGER
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+            known = self.index.getDir(dirpath, mtime) if self.index else None
+            if known:
+                subdirs, files = known
+                subdirs = [d for d in subdirs if not Film.isExcludedDir(d)]
+            else:
+                subdirs, files = [], []
+                with STATS.timed('listDir'), os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not Film.isExcludedDir(entry.name):
+                                subdirs.append(entry.name)
+                        elif self.keep(entry.name):
+                            files.append(entry.name)
+                subdirs.sort()
+                files.sort()
+        except OSError as e:
+            LOGGER.error("Dossier inaccessible '{}' : {}".format(dirpath, e))
+            return None
+        STATS.count('dirsFromIndex' if known else 'dirsListed')
+        if len(self.pending) < self.maxAhead:
+            self.prefetchSubdirs(dirpath, subdirs)
+        return bool(known), subdirs, files
+        
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        
+
 class MovieDB:
     " Small DB holding the found informations and able to make catalogus"
     def __init__(self, path): 
@@ -538,73 +2034,629 @@ class MovieDB:
         global MOVIE_SHEETS
         self.rootPath = path
         self.movieDB = []
-        self.movieCatalog = Catalog(os.path.join(self.rootPath, MOVIE_CATALOG))
-        self.noteFile = NoteFile(os.path.join(self.rootPath, MOVIE_SHEETS)) 
+        self.movieCatalog = Catalog(os.path.join(self.rootPath, MOVIE_CATALOG), sortRecords=SHARD is not None)
+        self.noteFile = NoteFile(os.path.join(self.rootPath, MOVIE_SHEETS), sortRecords=SHARD is not None)
+        # catalog and notes file of each other language of --languages
+        self.translationFiles = {language: (Catalog(os.path.join(self.rootPath, languageName(MOVIE_CATALOG, language)), sortRecords=SHARD is not None),
+                                            NoteFile(os.path.join(self.rootPath, languageName(MOVIE_SHEETS, language)), sortRecords=SHARD is not None))
+                                 for language in LANGUAGES[1:]}
         
     def lookForMovies(self):
-        for (dirpath, dirnames, filenames) in os.walk(self.rootPath):
-            for filename in filenames:
-                if Film.isMovie(filename, dirpath): 
-                    self.handleMovie(os.path.join(dirpath, filename))
+        "the films are written to the catalog and the notes file as soon as they are found, in the walk order"
+        global WORKERS
+        self.movieCatalog.open()
+        self.noteFile.open()
+        for catalog, noteFile in self.translationFiles.values():
+            catalog.open()
+            noteFile.open()
+        if WORKERS > 1:
+            self.handleMoviesConcurrently(self.findMovies(), addToFiles=True)
+        else:
+            for filepath, indexEntry in self.findMovies():
+                self.handleMovie(filepath, indexEntry=indexEntry, toFiles=True)
+                
+    def addToFiles(self, film):
+        self.movieCatalog.addFilm(film)
+        self.noteFile.addFilm(film)
+        for language, (catalog, noteFile) in self.translationFiles.items():
+            translated = film.translated(language)
+            catalog.addFilm(translated)
+            noteFile.addFilm(translated)
+        if JOURNAL:
+            JOURNAL.add(film)
+                    
+    def findMovies(self, dirpath=None):
+        """ yields (movie file, index entry or None) for the movies of the tree, always in the same order :
+            the files of a directory, then its sub directories.
+            The directories and files unchanged since the last run are taken from the ScanIndex."""
+        global INDEX
+        global JOURNAL
+        global SCAN_WORKERS
+        if dirpath is None:
+            self.walkCount = 0
+            self.scanner = DirScanner(SCAN_WORKERS, Film.isMovieName, INDEX, JOURNAL.isCompleted if JOURNAL else None)
+            try:
+                yield from self.findMovies(self.rootPath)
+            finally:
+                self.scanner.close()
+            return
+        resumed = JOURNAL.subtreeFilms(dirpath) if JOURNAL else None
+        if resumed is not None:
+            for entry in resumed:
+                self.walkCount += 1
+                yield entry['path'], entry
+            JOURNAL.walkEnded(dirpath, self.walkCount)
+            return
+        listing = self.scanner.get(dirpath)
+        if listing is None:
+            return
+        known, subdirs, movies = listing
+        if known:
+            indexEntries = INDEX.getFilms(dirpath)
+        else:
+            indexEntries = INDEX.getFilms(dirpath) if INDEX else {}
+            if INDEX:
+                INDEX.scanned(dirpath, subdirs, movies)
+        for filename in movies:
+            filepath = os.path.join(dirpath, filename)
+            if SHARD and not isInShard(filepath):
+                continue
+            indexEntry = indexEntries.get(filepath)
+            if indexEntry and not indexEntry['note']:
+                indexEntry = None     # films without sheet are searched again, as without index
+            if indexEntry and not known and not Film.isUnchanged(filepath, indexEntry):
+                indexEntry = None
+            if JOURNAL and JOURNAL.entry(filepath):
+                indexEntry = JOURNAL.entry(filepath)
+            self.walkCount += 1
+            STATS.count('filmsFromIndex' if indexEntry else 'filmsExamined')
+            yield filepath, indexEntry
+        for subdir in subdirs:
+            yield from self.findMovies(os.path.join(dirpath, subdir))
+        if JOURNAL:
+            JOURNAL.walkEnded(dirpath, self.walkCount)
                     
-    def handleMovie(self, filepath, dontKeepIfExist = False):
-        self.movieDB.append(Film(filepath, dontKeepIfExist))
+    def handleMovie(self, filepath, dontKeepIfExist = False, indexEntry = None, walkOrder = True, toFiles = False):
+        film = Film(filepath, dontKeepIfExist, indexEntry=indexEntry)
+        self.filmDone(film, walkOrder, toFiles)
+        return film
+        
+    def filmDone(self, film, walkOrder=True, toFiles=False):
+        """ the film is complete : kept in the scan index, the film store (at its rank in the walk if walkOrder) and movieDB.
+            toFiles : the film is written to the catalog and the notes file, then only its FilmRecord is kept in movieDB"""
+        if INDEX:
+            INDEX.putFilm(film)
+        if STORE:
+            STORE.putFilm(film, len(self.movieDB) + 1 if walkOrder else None)
+        if toFiles:
+            self.addToFiles(film)
+            film = FilmRecord(film)
+        self.movieDB.append(film)
+        
+    def handleFiles(self, filepaths, dontKeepIfExist=True, removed=()):
+        """ handles the given films (their previous informations are replaced unless dontKeepIfExist is False),
+            concurrently with WORKERS > 1, then updates the catalog and the notes file in a single pass,
+            where the films of the removed paths are also removed"""
+        global WORKERS
+        global LOGGER
+        films = []
+        for filepath in filepaths:
+            if os.path.isfile(filepath) and Film.isMovie(os.path.basename(filepath), os.path.dirname(filepath)):
+                films.append(filepath)
+            else:
+                LOGGER.error("Le fichier {} n'existe pas ou n'est pas un film.".format(filepath))
+        if WORKERS > 1:
+            self.handleMoviesConcurrently(((filepath, None) for filepath in films), dontKeepIfExist, walkOrder=False)
+        else:
+            for filepath in films:
+                self.handleMovie(filepath, dontKeepIfExist, walkOrder=False)
+        if self.movieDB or removed:
+            self.updateCatalog(removed)
+            self.updateMovieNotesFile(removed)
+        
+    def handleMoviesConcurrently(self, filepaths, dontKeepIfExist = False, addToFiles = False, walkOrder = True):
+        """ TMDB searches, notes and posters are run by a pool of WORKERS threads.
+            The films are taken back in the walk order to ask the operator (one question at a time),
+            then to fill movieDB (and the catalog and notes file if addToFiles), so that they keep a deterministic order."""
+        global WORKERS
+        global LOGGER
+        maxPending = WORKERS * 4      # bounds the number of films being searched ahead of the operator
+        lookups = collections.deque()
+        details = collections.deque()
+        
+        def takeBackFirstLookup(pool):
+            film, future = lookups.popleft()
+            try:
+                future.result()
+            except Exception as e:
+                LOGGER.error("Echec de la recherche TMDB pour '{}' : {}".format(film.filePath, e))
+            film.askOperator()
+            details.append((film, pool.submit(film.fetchDetails)))
+            
+        def takeBackFirstDetails():
+            film, future = details.popleft()
+            try:
+                future.result()
+            except Exception as e:
+                LOGGER.error("Echec de la création de la fiche pour '{}' : {}".format(film.filePath, e))
+            self.filmDone(film, walkOrder, toFiles=addToFiles)
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            for filepath, indexEntry in filepaths:
+                film = Film(filepath, dontKeepIfExist, resolve=False, indexEntry=indexEntry)
+                lookups.append((film, pool.submit(film.lookup)))
+                while len(lookups) > maxPending or (lookups and lookups[0][1].done()):
+                    takeBackFirstLookup(pool)
+                while len(details) > maxPending or (details and details[0][1].done()):
+                    takeBackFirstDetails()
+            while lookups:
+                takeBackFirstLookup(pool)
+            while details:
+                takeBackFirstDetails()
                     
+    def reviewMovies(self):
+        """ asks the operator the choices put in the review queue, with the candidates found during the walk,
+            then updates the catalog and the notes file in a single pass"""
+        global REVIEW
+        global LOGGER
+        pending = REVIEW.pending()
+        print("{} films en attente de choix.".format(len(pending)))
+        for filepath, candidates in pending:
+            if not os.path.isfile(filepath):
+                LOGGER.warning("Le fichier {} n'existe plus.".format(filepath))
+                REVIEW.done(filepath)
+                continue
+            film = Film(filepath, True, resolve=False)     # a sheet kept meanwhile is replaced by the answer
+            if film.toResolve:
+                film.possibleList = candidates
+                film.askOperator()
+                film.fetchDetails()
+                self.filmDone(film, walkOrder=False)
+            REVIEW.done(filepath)
+            REVIEW.save()     # the answers given so far are kept if the review is interrupted
+        if self.movieDB:
+            self.updateCatalog()
+            self.updateMovieNotesFile()
+        
+    def queryMovies(self, query):
+        "prints the catalog lines of the films of the store matching the query"
+        global STORE
+        try:
+            films = STORE.query(query)
+        except ValueError as e:
+            LOGGER.error(e)
+            return
+        for film in films:
+            print(self.movieCatalog.txtFormat(film), end='')
+        print("{} films trouvés.".format(len(films)))
+        
+    def exportMovies(self):
+        """ generates again the catalog, the notes file and the sheets from the store.
+            The store only has the first language : the files of the other languages take the existing sheets,
+            else the film untranslated"""
+        global STORE
+        global SHEET_SUFFIX
+        self.movieCatalog.open()
+        self.noteFile.open()
+        for catalog, noteFile in self.translationFiles.values():
+            catalog.open()
+            noteFile.open()
+        for film in STORE.films():
+            self.movieCatalog.addFilm(film)
+            self.noteFile.addFilm(film)
+            if film.note and os.path.isdir(os.path.dirname(film.filePath)):
+                Film.writeNote(film)
+            for language, (catalog, noteFile) in self.translationFiles.items():
+                translated = film
+                try:
+                    with open(os.path.splitext(film.filePath)[0] + languageName(SHEET_SUFFIX, language), "r", encoding="utf-8") as fh:
+                        note = fh.read()
+                    translated = film._replace(filmName=Film.parseNote(note).get('Titre', film.filmName), note=note)
+                except OSError:
+                    pass
+                catalog.addFilm(translated)
+                noteFile.addFilm(translated)
+        self.doBuildCatalog()
+        self.doBuildMovieNotesFile()
+        
+    def rebuildMovies(self):
+        """ --rebuild : writes again the catalog and the notes file from the existing sheets, TMDB is never queried.
+            The sheets are read and their paths corrected by SCAN_WORKERS threads (I/O bound, on network shares
+            mostly), while the tree is walked ; the films are written in the walk order, as soon as the previous
+            ones are read. Only the StoredFilm of the films being read are in memory."""
+        global SCAN_WORKERS
+        global SHEET_SUFFIX
+        global LOGGER
+        
+        def readNote(sheetPath, filepath):
+            "(note or None, True if the sheet was rewritten with the current path of the film)"
+            try:
+                with open(sheetPath, "r", encoding="utf-8") as fh:
+                    note = fh.read()
+            except FileNotFoundError:
+                return None, False
+            relocated = Film.relocatedNote(note, filepath)
+            if relocated is None:
+                return note, False
+            with open(sheetPath, "w", encoding="utf-8") as fh:
+                fh.write(relocated)
+            return relocated, True
+            
+        def readSheet(filepath):
+            "[(language or None for the first one, StoredFilm, sheet rewritten)]"
+            filmName, filmYear, fileExtension = Film.splitFilmName(filepath)
+            base = os.path.splitext(filepath)[0]
+            note, moved = readNote(base + SHEET_SUFFIX, filepath)
+            films = [(None, StoredFilm(filepath, filepath, filmName, filmYear, note), moved)]
+            for language in self.translationFiles:
+                note, moved = readNote(base + languageName(SHEET_SUFFIX, language), filepath)
+                title = Film.parseNote(note).get('Titre', filmName) if note else filmName
+                films.append((language, StoredFilm(filepath, filepath, title, filmYear, note), moved))
+            return films
+            
+        def written(future):
+            for films in future.result():
+                for language, film, moved in films:
+                    catalog, noteFile = self.translationFiles[language] if language else (self.movieCatalog, self.noteFile)
+                    catalog.addFilm(film)
+                    noteFile.addFilm(film)
+                    counts['relocated'] += moved
+                counts['films'] += 1
+                counts['sheets'] += films[0][1].note is not None
+            
+        self.movieCatalog.open()
+        self.noteFile.open()
+        for catalog, noteFile in self.translationFiles.values():
+            catalog.open()
+            noteFile.open()
+        counts = collections.Counter()
+        pending = collections.deque()     # batches of REBUILD_BATCH sheets being read, in the walk order
+        batch = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+            for filepath, indexEntry in self.findMovies():
+                batch.append(filepath)
+                if len(batch) == REBUILD_BATCH:
+                    pending.append(pool.submit(lambda batch: [readSheet(f) for f in batch], batch))
+                    batch = []
+                    while pending and (pending[0].done() or len(pending) >= SCAN_WORKERS * 4):
+                        written(pending.popleft())
+            pending.append(pool.submit(lambda batch: [readSheet(f) for f in batch], batch))
+            while pending:
+                written(pending.popleft())
+        self.doBuildCatalog()
+        self.doBuildMovieNotesFile()
+        message = "{} films, {} fiches, {} chemins corrigés.".format(counts['films'], counts['sheets'], counts['relocated'])
+        LOGGER.info(message)
+        print(message)
+        
+    def mergeFragments(self, catalogs, sheets):
+        "builds the catalog and the notes file from the fragments of the shards, TMDB is not queried"
+        global LOGGER
+        try:
+            self.movieCatalog.merge(catalogs)
+            self.noteFile.merge(sheets)
+            for language, (catalog, noteFile) in self.translationFiles.items():     # fragments besides, with the language
+                catalog.merge([languageName(path, language) for path in catalogs])
+                noteFile.merge([languageName(path, language) for path in sheets])
+        except (ValueError, OSError) as e:
+            LOGGER.error(e)
+            return
+        LOGGER.info("{} fragments fusionnés, {} films.".format(len(catalogs), self.movieCatalog.nbFilms))
+        print("{} fragments fusionnés, {} films.".format(len(catalogs), self.movieCatalog.nbFilms))
+        
     def doBuildMovieNotesFile(self):
-        "makes a single file gathering all the notes for the found films, instead of plenty of small notes here and there"
-        for mv in self.movieDB:
-            self.noteFile.addFilm(mv)
-        self.noteFile.writeFile()
-    
-    def updateMovieNotesFile(self):
-        """updates the existing sheets with the added film
-           In this case the db contains only 1 film"""
-        if self.noteFile.readFile():
-           self.noteFile.removeFilm(self.movieDB[0])
-           self.noteFile.addFilm(self.movieDB[0])
-           self.noteFile.writeFile()
+        "completes the file gathering all the notes for the found films, instead of plenty of small notes here and there"
+        self.noteFile.close()
+        for catalog, noteFile in self.translationFiles.values():
+            noteFile.close()
+    
+    def updateMovieNotesFile(self, removed=()):
+        """updates the existing sheets with the films of the db (usually only a few films)"""
+        self.noteFile.updateFilms(self.movieDB, removed)
+        for language, (catalog, noteFile) in self.translationFiles.items():
+            noteFile.updateFilms([film.translated(language) for film in self.movieDB], removed)
     
     def doBuildCatalog(self):
-        "makes a catalog listing the found files"
-        for mv in self.movieDB:
-            self.movieCatalog.addFilm(mv)
-        self.movieCatalog.writeFile()
-        
-    def updateCatalog(self):
-        """updates the existing catalog with the added film
-            In this case the db contains only 1 film"""
-        if self.movieCatalog.readFile():
-           self.movieCatalog.removeFilm(self.movieDB[0])
-           self.movieCatalog.addFilm(self.movieDB[0])
-           self.movieCatalog.writeFile()
-
-
-def doCleanup(p):
-    "Removes all the files generated by this tool"   
+        "completes the catalog listing the found files"
+        self.movieCatalog.close()
+        for catalog, noteFile in self.translationFiles.values():
+            catalog.close()
+        
+    def updateCatalog(self, removed=()):
+        """updates the existing catalog with the films of the db (usually only a few films)"""
+        self.movieCatalog.updateFilms(self.movieDB, removed)
+        for language, (catalog, noteFile) in self.translationFiles.items():
+            catalog.updateFilms([film.translated(language) for film in self.movieDB], removed)
+
+
+class Watcher:
+    """ --watch : after the walk, polls the mtime of the directories of the tree (one stat per directory, the files
+        are not listed) and lists again only the changed ones, to find the new, renamed and removed movie files.
+        A new file is resolved once its size and mtime did not change for `debounce` s (copy finished);
+        the catalog and the notes file are then updated in place with the new and removed films.
+        The directory states start from the ScanIndex saved by the walk, and the index is kept up to date."""
+    def __init__(self, movieDB, interval, debounce):
+        global INDEX
+        self.movieDB = movieDB
+        self.interval = interval
+        self.debounce = debounce
+        self.dirs = {dirpath: (mtime, subdirs, set(movies)) for dirpath, (mtime, subdirs, movies) in INDEX.dirs().items()}
+        self.pending = {}     # new movie file => (size, mtime, time when first seen with them)
+        self.removed = set()
+        
+    def run(self):
+        global LOGGER
+        LOGGER.info("Surveillance de '{}' (Ctrl-C pour arrêter)".format(self.movieDB.rootPath))
+        print("Surveillance de '{}' (Ctrl-C pour arrêter)".format(self.movieDB.rootPath))
+        while True:
+            with STATS.timed('watchPoll'):
+                self.poll()
+            ready = self.ready()
+            if ready or self.removed:
+                self.handle(ready)
+            time.sleep(self.interval)
+            
+    def listDir(self, dirpath):
+        "(mtime, sub directories, movies) of the directory, None if it does not exist any more"
+        try:
+            mtime = os.stat(dirpath).st_mtime_ns
+            subdirs, movies = [], set()
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not Film.isExcludedDir(entry.name):
+                            subdirs.append(entry.name)
+                    elif Film.isMovieName(entry.name):
+                        movies.add(entry.name)
+        except OSError:
+            return None
+        return mtime, sorted(subdirs), movies
+        
+    def poll(self):
+        "compares the changed directories with their previous state"
+        for dirpath in sorted(self.dirs):
+            if dirpath not in self.dirs:     # removed with its parent during this poll
+                continue
+            try:
+                mtime = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != self.dirs[dirpath][0]:
+                self.update(dirpath)
+        for filepath in list(self.pending):
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                del self.pending[filepath]
+                continue
+            size, mtime, since = self.pending[filepath]
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self.pending[filepath] = (st.st_size, st.st_mtime_ns, time.time())
+                
+    def update(self, dirpath):
+        global INDEX
+        listing = self.listDir(dirpath)
+        oldMtime, oldSubdirs, oldMovies = self.dirs.pop(dirpath, (None, [], set()))
+        if listing is None:
+            self.removeMovies(dirpath, oldMovies)
+            for subdir in oldSubdirs:
+                self.update(os.path.join(dirpath, subdir))
+            return
+        mtime, subdirs, movies = listing
+        self.dirs[dirpath] = listing
+        INDEX.scanned(dirpath, subdirs, sorted(movies))
+        self.removeMovies(dirpath, oldMovies - movies)
+        for filename in sorted(movies - oldMovies):
+            filepath = os.path.join(dirpath, filename)
+            if SHARD and not isInShard(filepath):
+                continue
+            self.removed.discard(filepath)
+            if filepath not in self.pending:
+                self.pending[filepath] = (None, None, time.time())
+        for subdir in set(oldSubdirs) ^ set(subdirs):     # new or removed sub directories
+            self.update(os.path.join(dirpath, subdir))
+            
+    def removeMovies(self, dirpath, filenames):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            if self.pending.pop(filepath, None) is None:
+                self.removed.add(filepath)
+                
+    def ready(self):
+        "new files unchanged since debounce s"
+        now = time.time()
+        return sorted(f for f, (size, mtime, since) in self.pending.items() if size is not None and now - since >= self.debounce)
+        
+    def handle(self, ready):
+        global LOGGER
+        global INDEX
+        global STORE
+        removed = sorted(self.removed)
+        for filepath in ready:
+            del self.pending[filepath]
+        for filepath in removed:
+            LOGGER.info("Film supprimé ou déplacé : '{}'".format(filepath))
+            removeGenerated(filepath)
+        LOGGER.info("{} nouveaux films, {} films supprimés".format(len(ready), len(removed)))
+        self.movieDB.movieDB = []
+        self.movieDB.handleFiles(ready, dontKeepIfExist=False, removed=removed)
+        for film in self.movieDB.movieDB:
+            if film.filePath != film.originalPath:      # renamed by the tool : not a new file at the next poll
+                mtime, subdirs, movies = self.dirs[os.path.dirname(film.filePath)]
+                movies.discard(os.path.basename(film.originalPath))
+                movies.add(os.path.basename(film.filePath))
+        if STORE:
+            STORE.removeFilms(removed)
+            STORE.commit()
+        INDEX.commit()
+        self.removed = set()
+        
+
+def removeGenerated(filepath):
+    "removes the sheet and the poster of a movie file which no longer exists"
+    global SHEET_SUFFIX
+    global POSTER_SUFFIX
+    global LOGGER
+    base = os.path.splitext(filepath)[0]
+    sheets = [base + SHEET_SUFFIX] + [base + languageName(SHEET_SUFFIX, language) for language in LANGUAGES[1:]]
+    for generated in sheets + [base + POSTER_SUFFIX + ext for ext in POSTER_EXTENSIONS]:
+        if os.path.isfile(generated):
+            os.remove(generated)
+            LOGGER.debug("Fichier supprimé : '{}'".format(generated))
+
+
+def buildClients():
+    """ Factory of the TMDB clients, only used by the modes which resolve films : sets RETRY_POLICY, MOVIE
+        and POSTERS (not offline), returns the ResponseCache to close at the end.
+        The network modules are imported by the clients when they send their first request."""
+    global RETRY_POLICY
+    global MOVIE
+    global POSTERS
+    global TRANSLATIONS
+    responseCache = ResponseCache(os.path.join(DIRPATH, CACHE_FILE), CACHE_DAYS, CACHE_SIZE)
+    RETRY_POLICY = RetryPolicy(RateLimiter(RATE), RETRIES)
+    MOVIE = MovieApi(KEY, LANGUAGES[0], cache=responseCache, offline=OFFLINE, retryPolicy=RETRY_POLICY)
+    if len(LANGUAGES) > 1:
+        TRANSLATIONS = concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS * (len(LANGUAGES) - 1))
+    if not OFFLINE:
+        POSTERS = PosterDownloader(POSTER_WORKERS, RETRY_POLICY, cache=responseCache)
+    return responseCache
+
+
+def isInShard(filepath):
+    """ True if the film belongs to the partition of this node, given by a hash of the path of its directory
+        relative to the root : the same on all the nodes, whatever their mount point or platform.
+        All the films of a directory are in the same shard, so that a film renamed by a node stays in its shard,
+        and the directory listings kept in the scan index of the other nodes are not concerned by the rename."""
+    global SHARD
+    global DIRPATH
+    relPath = os.path.relpath(os.path.dirname(filepath), DIRPATH).replace(os.sep, '/')
+    return zlib.crc32(relPath.encode('utf-8')) % SHARD[1] == SHARD[0] - 1
+    
+    
+def shardName(fileName):
+    "name of a working file of the root for the shard : ___CATALOGUE_FILMS.TXT => ___CATALOGUE_FILMS.2-3.TXT"
+    global SHARD
+    base, ext = os.path.splitext(fileName)
+    return "{}.{}-{}{}".format(base, SHARD[0], SHARD[1], ext)
+    
+    
+def languageName(fileName, language):
+    "name of a file for another language than the first one : ___FICHES_FILMS.TXT => ___FICHES_FILMS.en.TXT, _tmdb.txt => _tmdb.en.txt"
+    base, ext = os.path.splitext(fileName)
+    return "{}.{}{}".format(base, language, ext)
+    
+    
+def fragmentPairs(fragments):
+    """ (catalog fragments, notes fragments) from the catalog fragments given to --merge (paths or patterns) :
+        the notes fragment is besides its catalog fragment, with the same shard suffix"""
+    global LOGGER
+    global CATALOG
+    global SHEETS
+    catalogBase, catalogExt = os.path.splitext(CATALOG)
+    sheetsBase, sheetsExt = os.path.splitext(SHEETS)
+    catalogs, sheets = [], []
+    for catalog in listFiles(fragments):
+        name = os.path.basename(catalog)
+        if not (name.startswith(catalogBase) and name.endswith(catalogExt)):
+            LOGGER.error("'{}' n'est pas un fragment de catalogue ({}*{}).".format(catalog, catalogBase, catalogExt))
+            continue
+        sheet = os.path.join(os.path.dirname(catalog), sheetsBase + name[len(catalogBase):len(name) - len(catalogExt)] + sheetsExt)
+        if not (os.path.isfile(catalog) and os.path.isfile(sheet)):
+            LOGGER.error("Fragment incomplet : '{}' / '{}'".format(catalog, sheet))
+            continue
+        catalogs.append(catalog)
+        sheets.append(sheet)
+    return catalogs, sheets
+
+
+def listFiles(patterns, listPaths=()):
+    """ paths of the files given by --file (paths or patterns) and --files-from (one path or pattern per line),
+        without duplicates, in the given order"""
+    global LOGGER
+    import glob
+    patterns = list(patterns)
+    for listPath in listPaths:
+        try:
+            with open(listPath, "r", encoding="utf-8-sig") as fh:
+                patterns += [line.strip() for line in fh if line.strip()]
+        except OSError as e:
+            LOGGER.error("Liste de fichiers illisible '{}' : {}".format(listPath, e))
+    files = []
+    for pattern in patterns:
+        if any(c in pattern for c in '*?['):
+            found = sorted(glob.glob(pattern, recursive=True))
+            if not found:
+                LOGGER.error("Aucun fichier pour '{}'.".format(pattern))
+            files += found
+        else:
+            files.append(pattern)
+    return list(dict.fromkeys(os.path.normpath(f) for f in files))
+
+
+def doCleanup(p, dryRun=False):
+    """ Removes all the files generated by this tool (the TMDB answers cache is kept), found with the DirScanner :
+        the _NOTMDB directories are not walked. The names are matched exactly : sheets, posters (with an image extension)
+        and the aggregate and working files of the root. The files are removed by batches in parallel.
+        dryRun : only counts the files and their size"""
     global LOGGER
     global SHEET_SUFFIX
     global POSTER_SUFFIX
     global CATALOG
     global SHEETS
+    global SCAN_WORKERS
+    rootFiles = {SCAN_INDEX, JOURNAL_FILE, REVIEW_FILE, REVIEW_FILE + '.tmp', FILM_STORE, STATS_FILE, PROFILE_FILE}
+    for aggregate in (CATALOG, SHEETS):
+        rootFiles |= {aggregate, aggregate + dbFile.INDEX_SUFFIX, aggregate + dbFile.BODY_SUFFIX, aggregate + '.tmp'}
     
-    def isNote(f):
-        return True if SHEET_SUFFIX in f else False
-    
-    def isCatalogue(f):
-        return True if CATALOG in f else False
+    def isGenerated(f):
+        if f in rootFiles or f.endswith(SHEET_SUFFIX):
+            return True
+        general = re.sub(r'\.(\d+-\d+|[a-z]{2}(-[A-Z]{2})?)(?=\.)', '', f)     # without the shard and language parts
+        if general in rootFiles or general.endswith(SHEET_SUFFIX):
+            return True
+        base, ext = os.path.splitext(f[:-len('.part')] if f.endswith('.part') else f)
+        return base.endswith(POSTER_SUFFIX) and ext.lower() in POSTER_EXTENSIONS
     
-    def isSingleNote(f):
-        return True if SHEETS in f else False
-    
-    def isPoster(f):
-        return True if POSTER_SUFFIX in f else False
+    def removeBatch(batch):
+        "returns (files, bytes) removed"
+        count = size = 0
+        for filepath in batch:
+            try:
+                fileSize = os.stat(filepath).st_size
+                if not dryRun:
+                    os.remove(filepath)
+                    LOGGER.debug("Fichier supprimé : '{}'".format(filepath))
+                else:
+                    LOGGER.info("Fichier à supprimer : '{}'".format(filepath))
+            except OSError as e:
+                LOGGER.error("Impossible de supprimer '{}' : {}".format(filepath, e))
+                continue
+            count += 1
+            size += fileSize
+        return count, size
     
-    for (dirpath, dirnames, filenames) in os.walk(p):
-        for filename in filenames:
-            if isNote(filename) or isCatalogue(filename) or isSingleNote(filename) or isPoster(filename): 
-                filepath = os.path.join(dirpath, filename)
-                os.remove(filepath)
-                LOGGER.debug("Fichier supprimé : '{}'".format(filepath))
+    scanner = DirScanner(SCAN_WORKERS, isGenerated)
+    generated = []
+    dirs = [p]
+    try:
+        while dirs:
+            dirpath = dirs.pop()
+            listing = scanner.get(dirpath)
+            if listing:
+                known, subdirs, files = listing
+                generated += [os.path.join(dirpath, f) for f in files]
+                dirs += [os.path.join(dirpath, d) for d in reversed(subdirs)]
+    finally:
+        scanner.close()
+    batches = [generated[i:i + CLEANUP_BATCH] for i in range(0, len(generated), CLEANUP_BATCH)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        results = list(pool.map(removeBatch, batches))
+    count = sum(c for c, size in results)
+    size = sum(size for c, size in results)
+    message = "{} fichiers {} ({:.1f} Mo)".format(count, "à supprimer" if dryRun else "supprimés", size / 2**20)
+    LOGGER.info(message)
+    print(message)
                 
                 
                 
@@ -624,8 +2676,44 @@ if __name__ == "__main__":
         DIRPATH = arguments['<rootDirPath>']
         VERBOSE = True if arguments['--verbose'] else False
         KEY = arguments['--key']
-        FILE = arguments['--file']
+        FILES = arguments['--file']
+        FILES_FROM = arguments['--files-from']
         CLEANUP = True if arguments['--cleanup'] else False
+        DRY_RUN = True if arguments['--dry-run'] else False
+        WORKERS = max(1, int(arguments['--workers'] or 1))
+        OFFLINE = True if arguments['--offline'] else False
+        CACHE_DAYS = float(arguments['--cacheDays'])
+        CACHE_SIZE = float(arguments['--cacheSize'])
+        RATE = float(arguments['--rate'])
+        RETRIES = int(arguments['--retries'])
+        POSTER_WORKERS = max(1, int(arguments['--posterWorkers']))
+        SCAN_WORKERS = max(1, int(arguments['--scanWorkers']))
+        RESCAN = True if arguments['--rescan'] else False
+        RESUME = True if arguments['--resume'] else False
+        DEFER = True if arguments['--defer'] else False
+        REVIEW_MODE = True if arguments['--review'] else False
+        STORE_MODE = True if arguments['--store'] else False
+        QUERY = arguments['--query']
+        EXPORT = True if arguments['--export'] else False
+        STATS_MODE = True if arguments['--stats'] else False
+        PROFILE = True if arguments['--profile'] else False
+        LANGUAGES = list(dict.fromkeys(l.strip() for l in arguments['--languages'].split(',') if l.strip()))
+        if not LANGUAGES or not all(re.fullmatch(r'[a-z]{2}(-[A-Z]{2})?', l) for l in LANGUAGES):
+            raise ValueError(arguments['--languages'])
+        MERGE = arguments['--merge']
+        REBUILD = True if arguments['--rebuild'] else False
+        SHARD = None
+        if arguments['--shard']:
+            SHARD = tuple(int(n) for n in re.fullmatch(r'(\d+)/(\d+)', arguments['--shard']).groups())
+            if not 1 <= SHARD[0] <= SHARD[1]:
+                raise ValueError(arguments['--shard'])
+            # the nodes may share the root : each shard has its own working files and fragments
+            LOG_FILE, CACHE_FILE, SCAN_INDEX, FILM_STORE, JOURNAL_FILE, REVIEW_FILE, STATS_FILE, PROFILE_FILE, CATALOG, SHEETS = (
+                shardName(f) for f in (LOG_FILE, CACHE_FILE, SCAN_INDEX, FILM_STORE, JOURNAL_FILE, REVIEW_FILE,
+                                       STATS_FILE, PROFILE_FILE, CATALOG, SHEETS))
+        WATCH = True if arguments['--watch'] else False
+        WATCH_INTERVAL = max(0.1, float(arguments['--interval']))
+        WATCH_DEBOUNCE = max(0.0, float(arguments['--debounce']))
     except:
         print("ERROR: Incorrect parameters, use --help.")
         exit(1)
@@ -658,32 +2746,103 @@ if __name__ == "__main__":
     LOGGER.info("{} - TMDB_fetcher.py - {} - by C.Mineau".format(datetime.datetime.now(), VERSION))
     
     if CLEANUP:
-        doCleanup(DIRPATH)
+        doCleanup(DIRPATH, DRY_RUN)
+    elif REBUILD:   # the sheets alone, TMDB is not queried
+        MOVIE_CATALOG = os.path.join(DIRPATH, CATALOG)
+        MOVIE_SHEETS = os.path.join(DIRPATH, SHEETS)
+        MovieDB(DIRPATH).rebuildMovies()
+    elif MERGE:   # the fragments alone, TMDB is not queried
+        MOVIE_CATALOG = os.path.join(DIRPATH, CATALOG)
+        MOVIE_SHEETS = os.path.join(DIRPATH, SHEETS)
+        catalogs, sheets = fragmentPairs(MERGE)
+        if catalogs:
+            MovieDB(DIRPATH).mergeFragments(catalogs, sheets)
+    elif QUERY or EXPORT:   # the store alone, TMDB is not queried
+        storePath = os.path.join(DIRPATH, FILM_STORE)
+        if not os.path.isfile(storePath):
+            LOGGER.error("La base des films {} n'existe pas, utiliser l'option --store.".format(storePath))
+        else:
+            STORE = FilmStore(storePath)
+            MOVIE_CATALOG = os.path.join(DIRPATH, CATALOG)
+            MOVIE_SHEETS = os.path.join(DIRPATH, SHEETS)
+            movieDB = MovieDB(DIRPATH)
+            if QUERY:
+                movieDB.queryMovies(QUERY)
+            else:
+                movieDB.exportMovies()
+            STORE.close()
     else:
+        if PROFILE:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
     
-        TMDB.api_key = KEY
-        TMDB.language = 'fr'
-        TMDB.debug = False
+        responseCache = buildClients()
+        indexPath = os.path.join(DIRPATH, SCAN_INDEX)
+        if RESCAN and os.path.isfile(indexPath):
+            os.remove(indexPath)
+        INDEX = ScanIndex(indexPath)
+        if STORE_MODE or os.path.isfile(os.path.join(DIRPATH, FILM_STORE)):
+            STORE = FilmStore(os.path.join(DIRPATH, FILM_STORE))
         
         MOVIE_CATALOG = os.path.join(DIRPATH, CATALOG)
         MOVIE_SHEETS = os.path.join(DIRPATH, SHEETS)
         
         movieDB = MovieDB(DIRPATH)
+        REVIEW = ReviewQueue(os.path.join(DIRPATH, REVIEW_FILE))
         
-        if FILE:   # Only one file has to be handled, no need to walk through everything
-            filename = os.path.basename(FILE)
-            dirpath = os.path.dirname(FILE)
-            if os.path.isfile(FILE) and Film.isMovie(filename, dirpath): 
-                movieDB.handleMovie(FILE, dontKeepIfExist=True)
-                movieDB.updateCatalog()
-                movieDB.updateMovieNotesFile()
-            else:
-                LOGGER.error("Le fichier {} n'existe pas ou n'est pas un film.".format(FILE))
+        if REVIEW_MODE:
+            DEFER = False
+            movieDB.reviewMovies()
+        elif FILES or FILES_FROM:   # Only some files have to be handled, no need to walk through everything
+            movieDB.handleFiles(listFiles(FILES, FILES_FROM))
         else:      # walk through the Dir tree to find movies
-            movieDB.lookForMovies()
+            JOURNAL = Journal(os.path.join(DIRPATH, JOURNAL_FILE), RESUME)
+            try:
+                movieDB.lookForMovies()
+            except KeyboardInterrupt:
+                LOGGER.error("Traitement interrompu, il peut être repris avec l'option --resume.")
+                JOURNAL.close(completed=False)
+                os._exit(1)     # does not wait for the pending posters
             LOGGER.info("\n\n")
             movieDB.doBuildCatalog()
             movieDB.doBuildMovieNotesFile()
+            JOURNAL.close(completed=True)
+            if STORE:     # the films not found by the walk no longer exist
+                STORE.removeMissing({film.filePath for film in movieDB.movieDB})
+            if WATCH:
+                INDEX.commit(fullWalk=not JOURNAL.resumedSubtrees)
+                try:
+                    Watcher(movieDB, WATCH_INTERVAL, WATCH_DEBOUNCE).run()
+                except KeyboardInterrupt:
+                    LOGGER.info("Surveillance arrêtée.")
+        if POSTERS:
+            POSTERS.close()
+        if TRANSLATIONS:
+            TRANSLATIONS.shutdown()
+        INDEX.commit(fullWalk=JOURNAL is not None and not JOURNAL.resumedSubtrees)
+        if STORE:
+            STORE.close()
+        INDEX.close()
+        responseCache.close()
+        for coalescer in (SEARCHES, DETAILS):
+            LOGGER.info(coalescer.summary())
+            print(coalescer.summary())
+        if PROFILE:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(DIRPATH, PROFILE_FILE))
+            import pstats
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+            LOGGER.debug("Profil du traitement :\n{}".format(out.getvalue()))
+            print("Profil du traitement : '{}'".format(os.path.join(DIRPATH, PROFILE_FILE)))
+        if STATS_MODE:
+            for coalescer, name in ((SEARCHES, 'searches'), (DETAILS, 'details')):
+                STATS.count(name + 'Shared', coalescer.hits)
+                STATS.count(name + 'Made', coalescer.misses)
+            STATS.save(os.path.join(DIRPATH, STATS_FILE), version=VERSION, date=datetime.datetime.now().isoformat(),
+                       root=DIRPATH, workers=WORKERS, films=len(movieDB.movieDB))
+            print("Rapport de performance : '{}'".format(os.path.join(DIRPATH, STATS_FILE)))
     
     LOGGER.info("{} - Fin de traitement TMDB_fetcher.py ".format(datetime.datetime.now()))
     print("\nFin de traitement TMDB_fetcher.py ")
@@ -0,0 +1,85 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""Tests of the selection of the TMDB results (TitleMatcher), which renames the films without asking the operator.
+
+python -m unittest test_TMDB_fetcher
+"""
+
+import unittest
+
+from TMDB_fetcher import TitleMatcher, TMDBObj
+
+
+def candidate(title, date, originalTitle=None):
+    return TMDBObj(id=hash((title, date)), title=title, original_title=originalTitle or title, release_date=date, overview='')
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_accents_case_and_punctuation(self):
+        self.assertEqual(TitleMatcher.normalize("Amélie"), TitleMatcher.normalize("AMELIE !"))
+
+    def test_articles_removed(self):
+        self.assertEqual(TitleMatcher.normalize("Le Roi Lion"), "roi lion")
+        self.assertEqual(TitleMatcher.normalize("The Matrix"), "matrix")
+
+    def test_release_noise_removed(self):
+        self.assertEqual(TitleMatcher.normalize("Heat.1080p.x264.BluRay"), "heat")
+        self.assertEqual(TitleMatcher.normalize("Heat WEB-DL"), "heat")
+
+    def test_only_noise_kept(self):
+        self.assertEqual(TitleMatcher.normalize("The"), "the")
+
+    def test_part_marker(self):
+        self.assertEqual(TitleMatcher.normalize("Solo CD1"), "solo")
+        self.assertTrue(TitleMatcher.isPart("Solo CD1"))
+        self.assertTrue(TitleMatcher.isPart("Solo.part2"))
+        self.assertFalse(TitleMatcher.isPart("Solo"))
+
+    def test_numbers(self):
+        self.assertEqual(TitleMatcher.numbers(TitleMatcher.normalize("Rocky II")), {2})
+        self.assertEqual(TitleMatcher.numbers(TitleMatcher.normalize("Kill Bill : Volume 1")), {1})
+        self.assertEqual(TitleMatcher.numbers(TitleMatcher.normalize("I Am Legend")), set())
+
+
+class BestTest(unittest.TestCase):
+    def test_exact_title_and_year(self):
+        heat = candidate("Heat", "1995-12-15")
+        self.assertIs(TitleMatcher.best("Heat", "1995", [candidate("Heat", "1986-03-14"), heat])[0], heat)
+
+    def test_original_title(self):
+        amelie = candidate("Le Fabuleux Destin d'Amélie Poulain", "2001-04-25", "Amélie")
+        self.assertIs(TitleMatcher.best("Amelie", "2001", [amelie])[0], amelie)
+
+    def test_year_tolerance(self):
+        self.assertIsNotNone(TitleMatcher.best("Heat", "1996", [candidate("Heat", "1995-12-15")])[0])
+        self.assertIsNone(TitleMatcher.best("Heat", "1997", [candidate("Heat", "1995-12-15")])[0])
+
+    def test_remakes_without_year(self):
+        films = [candidate("Scarface", "1932-04-09"), candidate("Scarface", "1983-12-01")]
+        self.assertIsNone(TitleMatcher.best("Scarface", None, films)[0])
+
+    def test_part_never_selected(self):
+        self.assertIsNone(TitleMatcher.best("Solo CD1", "2018", [candidate("Solo", "2018-05-15")])[0])
+
+    def test_other_volume_not_selected(self):
+        film, score = TitleMatcher.best("Kill Bill Volume 2", "2003", [candidate("Kill Bill : Volume 1", "2003-10-10")])
+        self.assertIsNone(film)
+        self.assertEqual(score, 0.0)
+
+    def test_other_sequel_not_selected(self):
+        self.assertIsNone(TitleMatcher.best("Toy Story 2", "2010", [candidate("Toy Story 3", "2010-06-16")])[0])
+        self.assertIsNone(TitleMatcher.best("Toy Story", None, [candidate("Toy Story 2", "1999-11-24")])[0])
+
+    def test_sequel_selected(self):
+        sequel = candidate("Toy Story 2", "1999-11-24")
+        films = [candidate("Toy Story", "1995-11-22"), sequel, candidate("Toy Story 3", "2010-06-16")]
+        self.assertIs(TitleMatcher.best("Toy Story 2", "1999", films)[0], sequel)
+
+    def test_roman_numerals(self):
+        rocky = candidate("Rocky II", "1979-06-15")
+        self.assertIs(TitleMatcher.best("Rocky 2", "1979", [rocky])[0], rocky)
+        self.assertIsNone(TitleMatcher.best("Rocky III", "1979", [rocky])[0])
+
+
+if __name__ == "__main__":
+    unittest.main()